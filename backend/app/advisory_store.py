@@ -0,0 +1,65 @@
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal
+from .models import DiseaseAdvisory
+
+# Generated advisories are reused for this long; rebuilding the FAISS index invalidates them immediately
+ADVISORY_TTL_HOURS = float(os.getenv("ADVISORY_TTL_HOURS", 24 * 30))
+
+
+def _normalize_language(language: str) -> str:
+    return (language or "en").strip().lower()
+
+
+def get_advisory(disease_class: str, language: str, index_version: str):
+    """Return the stored advice for (class, language, index version), or None if missing/expired."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=ADVISORY_TTL_HOURS)
+    db = SessionLocal()
+    try:
+        row = db.query(DiseaseAdvisory.advice).filter(
+            DiseaseAdvisory.disease_class == disease_class,
+            DiseaseAdvisory.language == _normalize_language(language),
+            DiseaseAdvisory.index_version == index_version,
+            DiseaseAdvisory.created_at >= cutoff,
+        ).first()
+        return row.advice if row else None
+    finally:
+        db.close()
+
+
+def save_advisory(disease_class: str, language: str, index_version: str, advice: str):
+    """Insert or refresh the advisory for (class, language, index version)."""
+    language = _normalize_language(language)
+    db = SessionLocal()
+    try:
+        row = db.query(DiseaseAdvisory).filter(
+            DiseaseAdvisory.disease_class == disease_class,
+            DiseaseAdvisory.language == language,
+            DiseaseAdvisory.index_version == index_version,
+        ).first()
+        if row is None:
+            row = DiseaseAdvisory(disease_class=disease_class, language=language, index_version=index_version)
+            db.add(row)
+        row.advice = advice
+        row.created_at = datetime.now(timezone.utc)
+        db.commit()
+    except IntegrityError:
+        # Another worker stored the same key concurrently; its copy is just as good
+        db.rollback()
+    finally:
+        db.close()
+
+
+def purge_stale_advisories(index_version: str) -> int:
+    """Delete advisories generated against any other index version. Returns the number removed."""
+    db = SessionLocal()
+    try:
+        removed = db.query(DiseaseAdvisory).filter(
+            DiseaseAdvisory.index_version != index_version
+        ).delete(synchronize_session=False)
+        db.commit()
+        return removed
+    finally:
+        db.close()
@@ -0,0 +1,213 @@
+import os
+import json
+import numpy as np
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import AlertState, AlertEvent
+from .manager import manager
+from .rules import rule_sets
+
+# A (user, alert type) is notified at most once per cooldown, however often it flaps
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", 1800))
+# A condition that stays raised is re-sent this often (0: only when it is raised)
+ALERT_REPEAT_SECONDS = float(os.getenv("ALERT_REPEAT_SECONDS", 6 * 3600))
+
+RAISE, CLEAR = 1, -1
+_STATE_CHUNK = 500
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _utc(ts):
+    if ts is None:
+        return None
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class AlertEngine:
+    """
+    State machine per (user, alert type). An observation either raises or clears the alert;
+    a notification is produced only when an alert is raised (outside the cooldown since the
+    last one) or when a raised alert has stayed up for ALERT_REPEAT_SECONDS. States and
+    history rows are written in bulk in the caller's transaction.
+    """
+
+    def __init__(self, cooldown: float = ALERT_COOLDOWN_SECONDS, repeat: float = ALERT_REPEAT_SECONDS):
+        self.cooldown = cooldown
+        self.repeat = repeat
+        self.observed = 0
+        self.raised = 0
+        self.cleared = 0
+        self.notified = 0
+        self.suppressed = 0
+
+    def _load_states(self, db, keys) -> dict:
+        user_ids = sorted({user_id for user_id, _ in keys})
+        alert_types = sorted({alert_type for _, alert_type in keys})
+        states = {}
+        for i in range(0, len(user_ids), _STATE_CHUNK):
+            rows = db.query(
+                AlertState.user_id, AlertState.alert_type, AlertState.active,
+                AlertState.changed_at, AlertState.last_notified_at,
+            ).filter(
+                AlertState.user_id.in_(user_ids[i:i + _STATE_CHUNK]),
+                AlertState.alert_type.in_(alert_types),
+            )
+            for row in rows:
+                states[(row.user_id, row.alert_type)] = {
+                    "active": bool(row.active), "changed_at": row.changed_at,
+                    "last_notified_at": _utc(row.last_notified_at),
+                }
+        return states
+
+    def _save(self, db, changed: dict, events: list):
+        if changed:
+            values = [
+                {"user_id": user_id, "alert_type": alert_type, **state}
+                for (user_id, alert_type), state in sorted(changed.items())  # fixed lock order
+            ]
+            dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+            for i in range(0, len(values), _STATE_CHUNK):
+                chunk = values[i:i + _STATE_CHUNK]
+                if dialect_insert is None:
+                    for value in chunk:
+                        db.merge(AlertState(**value))
+                    continue
+                stmt = dialect_insert(AlertState).values(chunk)
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["user_id", "alert_type"],
+                    set_={column: stmt.excluded[column] for column in ("active", "value", "changed_at", "last_notified_at")},
+                ))
+        if events:
+            db.execute(insert(AlertEvent), events)
+
+    def apply(self, db, observations, now: datetime = None) -> dict:
+        """
+        observations: (user_id, alert_type, RAISE or CLEAR, value, message) tuples, at most one per
+        (user, type). Returns {user_id: [messages]} to send.
+        """
+        observations = list(observations)
+        if not observations:
+            return {}
+        now = now or datetime.now(timezone.utc)
+        states = self._load_states(db, [(obs[0], obs[1]) for obs in observations])
+
+        changed, events, notifications = {}, [], {}
+        for user_id, alert_type, signal, value, message in observations:
+            self.observed += 1
+            key = (user_id, alert_type)
+            state = states.get(key, {"active": False, "changed_at": None, "last_notified_at": None})
+            last = state["last_notified_at"]
+            since_last = (now - last).total_seconds() if last is not None else None
+
+            if signal == RAISE and not state["active"]:
+                self.raised += 1
+                notify = since_last is None or since_last >= self.cooldown
+                event = "raised"
+            elif signal == RAISE and self.repeat and (since_last is None or since_last >= self.repeat):
+                notify, event = True, "repeated"
+            elif signal == CLEAR and state["active"]:
+                self.cleared += 1
+                notify, event = False, "cleared"
+            else:
+                continue  # no change
+
+            if event == "raised" and not notify:
+                self.suppressed += 1
+            if notify:
+                self.notified += 1
+                notifications.setdefault(user_id, []).append(message)
+                last = now
+            changed[key] = {
+                "active": 0 if event == "cleared" else 1,
+                "value": None if value is None else float(value),
+                "changed_at": state["changed_at"] if event == "repeated" else now,
+                "last_notified_at": last,
+            }
+            events.append({
+                "user_id": user_id, "alert_type": alert_type, "event": event,
+                "value": None if value is None else float(value),
+                "message": message if notify else None, "created_at": now,
+            })
+
+        self._save(db, changed, events)
+        return notifications
+
+    def stats(self) -> dict:
+        return {
+            "cooldown_seconds": self.cooldown,
+            "repeat_seconds": self.repeat,
+            "observed": self.observed,
+            "raised": self.raised,
+            "cleared": self.cleared,
+            "notified": self.notified,
+            "suppressed_by_cooldown": self.suppressed,
+        }
+
+
+alert_engine = AlertEngine()
+
+
+def rule_observations(rule_set: str, user_ids, data: dict) -> list:
+    """
+    Evaluate a rule set (app/rules.py) over column arrays aligned with user_ids and turn the
+    rows that raise or clear an alert into engine observations. Alert types are rule names.
+    """
+    rules = rule_sets[rule_set]
+    observations = []
+    for alert_type, (raised, cleared) in rules.evaluate(data).items():
+        value_field = rules.rule(alert_type)["value"]
+        for i in np.flatnonzero(raised | cleared):
+            value = data[value_field][i]
+            value = float(value) if isinstance(value, (float, np.floating)) and not np.isnan(value) else None
+            if raised[i]:
+                observations.append((int(user_ids[i]), alert_type, RAISE, value, rules.format(alert_type, data, i)))
+            else:
+                observations.append((int(user_ids[i]), alert_type, CLEAR, value, None))
+    return observations
+
+
+def sensor_observations(user_ids, readings: dict) -> list:
+    """Observations for the newest reading of each user; `readings` maps metric -> array (NaN if not reported)."""
+    return rule_observations("sensor", user_ids, readings)
+
+
+def weather_observations(user_ids, city, condition: np.ndarray, rain_prob: np.ndarray) -> list:
+    """Observations for users whose forecast was checked (condition != "")."""
+    checked = np.flatnonzero(condition != "")
+    return rule_observations("weather", np.asarray(user_ids)[checked], {
+        "condition": condition[checked],
+        "rain_prob": rain_prob[checked],
+        "city": np.asarray(city, dtype=object)[checked],
+    })
+
+
+def evaluate_sensor_rows(db, rows, now: datetime = None) -> dict:
+    """Run the sensor alerts over freshly stored readings (one per user: the newest) -> {user_id: [messages]}."""
+    newest = {}
+    for row in rows:
+        user_id = row["user_id"]
+        if user_id is None or row["timestamp"] is None:
+            continue
+        if user_id not in newest or row["timestamp"] >= newest[user_id]["timestamp"]:
+            newest[user_id] = row
+    if not newest:
+        return {}
+    user_ids = sorted(newest)
+    readings = {
+        metric: np.array([np.nan if newest[u][metric] is None else newest[u][metric] for u in user_ids], dtype=np.float64)
+        for metric in rule_sets["sensor"].fields
+    }
+    return alert_engine.apply(db, sensor_observations(user_ids, readings), now)
+
+
+async def deliver_alerts(notifications: dict, timestamp: datetime = None):
+    """Push {user_id: [messages]} to each user's websockets (all workers)."""
+    if not notifications:
+        return
+    stamp = str(timestamp or datetime.now(timezone.utc))
+    await manager.send_to_users([
+        (user_id, json.dumps({"user_id": user_id, "messages": messages, "timestamp": stamp}))
+        for user_id, messages in notifications.items()
+    ])
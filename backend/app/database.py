@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
@@ -30,3 +30,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def sync_schema(metadata):
+    """
+    Create missing tables, then add what create_all skips on existing tables:
+    new nullable columns and new indexes. (No migrations framework; anything else
+    still needs reset_db.py or a manual ALTER.)
+    """
+    metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable or column.primary_key:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            print(f"🛠️ Added column {table.name}.{column.name}")
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
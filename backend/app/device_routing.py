@@ -0,0 +1,86 @@
+import os
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+from .cache import LRUCache
+from .database import SessionLocal
+from .models import User
+
+# device_id -> active user ids. Changes made through this process invalidate entries on commit;
+# the TTL bounds staleness for changes made by other workers or directly in the DB.
+DEVICE_ROUTING_CACHE_SIZE = int(os.getenv("DEVICE_ROUTING_CACHE_SIZE", 100000))
+DEVICE_ROUTING_TTL_SECONDS = float(os.getenv("DEVICE_ROUTING_TTL_SECONDS", 300)) or None
+
+_PENDING_KEY = "device_routing_invalidate"
+_ALL_DEVICES = object()  # a changed user whose device_id wasn't loaded: drop every route
+
+
+class DeviceRoutingCache:
+    """Which (non-deleted) users a device reports for, so sensor ingest never touches `users`."""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.routes = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def cached(self, device_id: str):
+        """Cached user ids for the device, or None if not cached (an empty tuple means unregistered)."""
+        return self.routes.get(device_id)
+
+    def resolve(self, device_id: str) -> tuple:
+        """Look up (and cache) the device's users. Blocking DB query; call from the thread pool."""
+        user_ids = self.routes.get(device_id)
+        if user_ids is not None:
+            return user_ids
+        db = SessionLocal()
+        try:
+            rows = db.query(User.id).filter(
+                User.device_id == device_id,
+                or_(User.is_deleted.is_(None), User.is_deleted != 1),
+            ).order_by(User.id).all()
+        finally:
+            db.close()
+        user_ids = tuple(row.id for row in rows)
+        self.routes.put(device_id, user_ids)
+        return user_ids
+
+    def invalidate(self, *device_ids):
+        if _ALL_DEVICES in device_ids:
+            self.routes.clear()
+            return
+        for device_id in device_ids:
+            if device_id is not None:
+                self.routes.pop(device_id)
+
+    def clear(self):
+        self.routes.clear()
+
+    def stats(self) -> dict:
+        return self.routes.stats()
+
+
+device_routes = DeviceRoutingCache(DEVICE_ROUTING_CACHE_SIZE, DEVICE_ROUTING_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_binding_changes(session, flush_context):
+    """Remember the old and new device_id of every user whose binding or deleted flag changed."""
+    touched = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        device = state.attrs.device_id.history
+        deleted = state.attrs.is_deleted.history
+        if obj in session.new or obj in session.deleted or device.has_changes() or deleted.has_changes():
+            values = list(device.added or ()) + list(device.deleted or ()) + list(device.unchanged or ())
+            touched.update(values if values else [_ALL_DEVICES])
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_routes(session):
+    # Only after commit: a lookup before then would still read (and cache) the old binding
+    device_routes.invalidate(*session.info.pop(_PENDING_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_binding_changes(session):
+    session.info.pop(_PENDING_KEY, None)
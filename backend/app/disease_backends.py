@@ -0,0 +1,82 @@
+import os
+import threading
+import numpy as np
+
+# Intra-op threads for the converted runtimes (0 = runtime default, usually one per core)
+DISEASE_CNN_THREADS = int(os.getenv("DISEASE_CNN_THREADS", 0))
+
+
+class OnnxDiseaseModel:
+    """
+    ONNX Runtime session for the converted disease CNN (convert_disease_model.py).
+    Mirrors the Keras `predict(x, verbose=0)` call so the disease router is backend-agnostic.
+    """
+    backend = "onnx"
+
+    def __init__(self, path: str, num_threads: int = DISEASE_CNN_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, x, batch_size=None, verbose=0):
+        # InferenceSession.run is thread-safe
+        return self.session.run(None, {self.input_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+class TFLiteDiseaseModel:
+    """
+    TFLite interpreter for the converted disease CNN, float or int8-quantized.
+    Uses tflite_runtime when installed so serving does not need full TensorFlow.
+    """
+    backend = "tflite"
+
+    def __init__(self, path: str, num_threads: int = DISEASE_CNN_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch = int(self.input["shape"][0])
+        # An interpreter holds its tensors in place, so concurrent invokes must be serialized
+        self._lock = threading.Lock()
+
+    def _resize(self, batch: int):
+        self.interpreter.resize_tensor_input(self.input["index"], [batch, *self.input["shape"][1:]])
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch = batch
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if x.shape[0] != self._batch:
+                self._resize(x.shape[0])
+
+            scale, zero_point = self.input["quantization"]
+            if self.input["dtype"] != np.float32 and scale:
+                info = np.iinfo(self.input["dtype"])
+                x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self.input["dtype"])
+            self.interpreter.set_tensor(self.input["index"], x)
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32 and scale:
+            y = (y.astype(np.float32) - zero_point) * scale
+        return y
+
+
+BACKENDS = {
+    "onnx": OnnxDiseaseModel,
+    "tflite": TFLiteDiseaseModel,
+}
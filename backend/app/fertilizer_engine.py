@@ -0,0 +1,78 @@
+import os
+import numpy as np
+
+# Default location of the exported weights (see backend/export_fertilizer_npz.py)
+NPZ_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fertilizer_mlp.npz")
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0, out=x),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+class NumpyFertilizerModel:
+    """
+    Pure-NumPy replacement for the Keras fertilizer MLP *and* its fitted ColumnTransformer.
+
+    It exposes the same `transform(df)` / `predict(X)` calls as the preprocessor and the
+    Keras model, so it can be dropped into `ml_models` for both, plus a `predict_rows`
+    shortcut that skips pandas entirely for the request path.
+    """
+
+    def __init__(self, path: str = NPZ_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            self.num_columns = [str(c) for c in data["num_columns"]]
+            self.cat_column = str(data["cat_column"])
+            self.categories = [str(c) for c in data["categories"]]
+            self.mean = data["scaler_mean"].astype(np.float64)
+            self.scale = data["scaler_scale"].astype(np.float64)
+            self.activations = [str(a) for a in data["activations"]]
+            self.layers = [
+                (data[f"kernel_{i}"].astype(np.float32), data[f"bias_{i}"].astype(np.float32))
+                for i in range(len(self.activations))
+            ]
+        unknown = set(self.activations) - set(ACTIVATIONS)
+        if unknown:
+            raise ValueError(f"Unsupported activation(s) in {path}: {sorted(unknown)}")
+        self._category_index = {name: i for i, name in enumerate(self.categories)}
+        self.n_features = len(self.num_columns) + len(self.categories)
+
+    def _encode(self, crops, numeric: np.ndarray) -> np.ndarray:
+        X = np.zeros((len(crops), self.n_features), dtype=np.float32)
+        n_num = len(self.num_columns)
+        X[:, :n_num] = (numeric - self.mean) / self.scale
+        for row, crop in enumerate(crops):
+            # OneHotEncoder(handle_unknown='ignore'): unknown crops get an all-zero block
+            col = self._category_index.get(crop)
+            if col is not None:
+                X[row, n_num + col] = 1.0
+        return X
+
+    def transform(self, df) -> np.ndarray:
+        """Equivalent of the fitted ColumnTransformer: scaled numerics followed by the one-hot crop."""
+        numeric = df[self.num_columns].to_numpy(dtype=np.float64)
+        return self._encode(df[self.cat_column].tolist(), numeric)
+
+    def predict(self, X, batch_size=None, verbose=0) -> np.ndarray:
+        """Forward pass; signature mirrors keras.Model.predict so callers need not care which backend is loaded."""
+        out = np.asarray(X, dtype=np.float32)
+        for (kernel, bias), activation in zip(self.layers, self.activations):
+            out = out @ kernel
+            out += bias
+            out = ACTIVATIONS[activation](out)
+        return out
+
+    def predict_rows(self, rows, fields) -> np.ndarray:
+        """
+        Predict straight from request objects without building a DataFrame.
+        `fields` maps request attribute -> training column (ml.FERTILIZER_COLUMNS).
+        """
+        column_to_field = {column: field for field, column in fields.items()}
+        numeric = np.array(
+            [[getattr(row, column_to_field[c]) for c in self.num_columns] for row in rows],
+            dtype=np.float64,
+        )
+        crops = [getattr(row, column_to_field[self.cat_column]) for row in rows]
+        return self.predict(self._encode(crops, numeric))
@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, StatementError
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import SessionLocal
+from .models import SensorLog
+from .rollups import upsert_rollups
+from .latest_state import upsert_latest_state
+from .alerts import evaluate_sensor_rows, deliver_alerts
+
+# Reading columns copied from the request payload into sensor_logs
+SENSOR_FIELDS = ("moisture", "nitrogen", "phosphorus", "potassium", "temperature", "humidity")
+# Rows per INSERT statement; keeps large batches under driver bind-parameter limits
+INSERT_CHUNK_ROWS = 500
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# Rows that could not be stored on their own (kept for inspection via /metrics)
+DEAD_LETTER_KEEP = 100
+
+
+def is_row_error(e: Exception) -> bool:
+    """Errors caused by the rows themselves (constraint, bad value), as opposed to the DB being unavailable."""
+    if isinstance(e, (IntegrityError, DataError)):
+        return True
+    # Raised by SQLAlchemy while binding a value, before anything reached the DB
+    return isinstance(e, StatementError) and not isinstance(e, DBAPIError)
+
+
+def insert_sensor_rows(db, rows: list, chunk_rows: int = INSERT_CHUNK_ROWS, alerts: dict = None) -> int:
+    """
+    Multi-row INSERT of sensor_logs rows in the caller's transaction. Rows that already exist
+    (same device_id, timestamp, user_id) are skipped, so re-sent readings are harmless.
+    The rows actually inserted are added to the 1m/1h/1d rollups and the per-user latest state
+    in the same transaction. With `alerts` (a dict), readings that became a user's latest are
+    run through the alert engine and the notifications to send are added to it.
+    Returns the number of rows inserted (where the driver reports it).
+    """
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    inserted = 0
+    for i in range(0, len(rows), chunk_rows):
+        if dialect_insert is None:
+            result = db.execute(insert(SensorLog).values(rows[i:i + chunk_rows]))
+            inserted += max(result.rowcount, 0)
+            continue
+        stmt = dialect_insert(SensorLog).values(rows[i:i + chunk_rows]).on_conflict_do_nothing(
+            index_elements=["device_id", "timestamp", "user_id"]
+        ).returning(
+            SensorLog.id, SensorLog.user_id, SensorLog.device_id, SensorLog.timestamp,
+            *[getattr(SensorLog, f) for f in SENSOR_FIELDS],
+        )
+        new_rows = [row._mapping for row in db.execute(stmt)]
+        upsert_rollups(db, new_rows, SENSOR_FIELDS)
+        advanced = upsert_latest_state(db, new_rows, evaluated=alerts is not None)
+        if alerts is not None:
+            for user_id, messages in evaluate_sensor_rows(db, advanced.values()).items():
+                alerts.setdefault(user_id, []).extend(messages)
+        inserted += len(new_rows)
+    return inserted
+
+
+def write_sensor_rows(rows: list, alerts: dict = None) -> int:
+    """Insert rows synchronously in a single transaction (blocking). Returns rows inserted."""
+    db = SessionLocal()
+    try:
+        inserted = insert_sensor_rows(db, rows, alerts=alerts)
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class SensorWriteBuffer:
+    """
+    Write-behind buffer for sensor_logs. Requests append rows and return immediately; a
+    background task bulk-inserts everything pending with multi-row INSERTs in one transaction,
+    once `max_rows` rows are waiting or `interval_seconds` have passed. Rows carry their
+    own timestamp (set on arrival), so flush delay never shifts the recorded time.
+    If the DB is unavailable, rows are kept and retried up to `max_pending`; beyond that
+    `add` refuses new rows so devices back off instead of the process growing unbounded.
+    If a batch fails because of its rows (e.g. a user deleted meanwhile), it is split in halves
+    until the bad rows are isolated: the rest is stored and the bad rows are dead-lettered.
+    Alerts raised by a flush are pushed to the websockets once it has committed.
+    """
+
+    def __init__(self, max_rows: int = 500, interval_seconds: float = 1.0, max_pending: int = 50000):
+        self.max_rows = max(1, max_rows)
+        self.interval = max(0.01, interval_seconds)
+        self.max_pending = max(self.max_rows, max_pending)
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+        self._loop = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.dead_letters = deque(maxlen=DEAD_LETTER_KEEP)  # (error, row)
+        self._deliveries = set()  # alert deliveries scheduled on the loop, not finished yet
+        self.alert_delivery_failures = 0
+        self.max_flush_rows = 0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    def add(self, rows: list) -> bool:
+        """Queue rows for insertion. Returns False (nothing queued) if the buffer is full."""
+        with self._lock:
+            if len(self._rows) + len(rows) > self.max_pending:
+                self.rejected += len(rows)
+                return False
+            self._rows.extend(rows)
+            self.accepted += len(rows)
+            pending = len(self._rows)
+        if pending >= self.max_rows and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def _write(self, rows: list, alerts: dict):
+        """One transaction; alerts are only merged in once it has committed."""
+        batch_alerts = {}
+        db = SessionLocal()
+        try:
+            insert_sensor_rows(db, rows, alerts=batch_alerts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for user_id, messages in batch_alerts.items():
+            alerts.setdefault(user_id, []).extend(messages)
+
+    def _requeue(self, rows: list):
+        with self._lock:
+            # Keep the oldest rows first; what no longer fits is dropped (and counted)
+            merged = rows + self._rows
+            self._rows = merged[:self.max_pending]
+            overflow = len(merged) - len(self._rows)
+        if overflow:
+            self.dropped += overflow
+            print(f"⚠️ Sensor buffer full: dropped {overflow} rows")
+
+    def flush(self) -> int:
+        """Insert everything pending (blocking). Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            alerts = {}
+            written = 0
+            segments = [rows]
+            while segments:
+                segment = segments.pop()
+                try:
+                    self._write(segment, alerts)
+                    written += len(segment)
+                except Exception as e:
+                    if not is_row_error(e):
+                        # DB unavailable: retry everything not yet stored on the next flush
+                        self.failed_flushes += 1
+                        remaining = [row for part in segments + [segment] for row in part]
+                        self._requeue(remaining)
+                        print(f"❌ Sensor log flush failed ({len(remaining)} rows kept for retry): {e}")
+                        break
+                    if len(segment) == 1:
+                        self.dead_lettered += 1
+                        self.dead_letters.append((str(e).splitlines()[0], segment[0]))
+                        print(f"❌ Dropped sensor row for user {segment[0].get('user_id')}: {str(e).splitlines()[0]}")
+                        continue
+                    # Bisect: the halves are retried separately (first half first)
+                    middle = len(segment) // 2
+                    segments += [segment[middle:], segment[:middle]]
+
+            if written:
+                self.flushes += 1
+                self.flushed_rows += written
+                self.max_flush_rows = max(self.max_flush_rows, written)
+                self.total_flush_seconds += time.perf_counter() - started
+            if alerts and self._loop is not None and not self._loop.is_closed():
+                delivery = asyncio.run_coroutine_threadsafe(deliver_alerts(alerts), self._loop)
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._delivery_done)
+            return written
+
+    def _delivery_done(self, delivery):
+        self._deliveries.discard(delivery)
+        if delivery.cancelled():
+            self.alert_delivery_failures += 1
+            print("❌ Sensor alert delivery cancelled")
+        elif delivery.exception() is not None:
+            self.alert_delivery_failures += 1
+            print(f"❌ Sensor alert delivery failed: {delivery.exception()}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await loop.run_in_executor(None, self.flush)
+
+    async def stop(self):
+        """
+        Stop the background task, write out whatever is still pending and wait for its alerts
+        to be handed to the websocket manager (call before shutting the manager down).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+        if self._deliveries:
+            await asyncio.gather(*(asyncio.wrap_future(d) for d in list(self._deliveries)), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pending_rows": len(self._rows),
+            "max_rows": self.max_rows,
+            "interval_seconds": self.interval,
+            "accepted_rows": self.accepted,
+            "rejected_rows": self.rejected,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "dropped_rows": self.dropped,
+            "dead_lettered_rows": self.dead_lettered,
+            "alert_delivery_failures": self.alert_delivery_failures,
+            "recent_dead_letters": [
+                {"error": error, "user_id": row.get("user_id"), "device_id": row.get("device_id")}
+                for error, row in list(self.dead_letters)[-5:]
+            ],
+            "max_flush_rows": self.max_flush_rows,
+            "mean_flush_ms": round(1000.0 * self.total_flush_seconds / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+sensor_buffer = SensorWriteBuffer(
+    max_rows=int(os.getenv("SENSOR_FLUSH_MAX_ROWS", 500)),
+    interval_seconds=float(os.getenv("SENSOR_FLUSH_INTERVAL_SECONDS", 1.0)),
+    max_pending=int(os.getenv("SENSOR_BUFFER_MAX_ROWS", 50000)),
+)
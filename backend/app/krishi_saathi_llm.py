@@ -7,10 +7,8 @@ from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-try:
-    from langchain_huggingface import HuggingFaceEmbeddings
-except ImportError:
-    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from .vectorstores import get_embeddings, load_faiss_index, register_vectorstore
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -271,10 +269,11 @@ Ask **exactly one** short question that would help refine the next advisory, e.g
 # VECTORSTORE
 # -----------------------------------------------------------------
 def build_or_load_vectorstore(pdf_paths: List[str], index_dir: str) -> FAISS:
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-
+    # Embedding model and saved index are shared process-wide (see app/vectorstores.py)
     if os.path.isdir(index_dir) and os.listdir(index_dir):
-        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        return load_faiss_index(index_dir, EMBEDDING_MODEL_NAME)
+
+    embeddings = get_embeddings(EMBEDDING_MODEL_NAME)
 
     docs = []
     for path in pdf_paths:
@@ -286,7 +285,7 @@ def build_or_load_vectorstore(pdf_paths: List[str], index_dir: str) -> FAISS:
 
     vectordb = FAISS.from_documents(chunks, embedding=embeddings)
     vectordb.save_local(index_dir)
-    return vectordb
+    return register_vectorstore(index_dir, EMBEDDING_MODEL_NAME, vectordb)
 
 
 # -----------------------------------------------------------------
@@ -0,0 +1,92 @@
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import SensorLog, LatestSensorState
+
+# Columns mirrored from sensor_logs (sensor_logs.id is stored as sensor_log_id)
+STATE_FIELDS = ("device_id", "moisture", "nitrogen", "phosphorus", "potassium", "temperature", "humidity", "timestamp")
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert_latest_state(db, rows, evaluated: bool = False) -> dict:
+    """
+    Record the newest of freshly inserted sensor_logs rows (mappings with id, user_id and
+    STATE_FIELDS) as each user's latest state, in the caller's transaction. A row only replaces
+    the stored state if it is newer, so late bulk uploads of old readings never move it back.
+    `evaluated` marks the rows as already run through the sensor alerts (the scheduler skips them).
+    Returns user_id -> row for the users whose latest state moved to one of these rows.
+    """
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        return {}
+
+    newest = {}
+    for row in rows:
+        user_id = row["user_id"]
+        if user_id is None or row["timestamp"] is None:
+            continue
+        current = newest.get(user_id)
+        if current is None or (row["timestamp"], row["id"]) > (current["timestamp"], current["id"]):
+            newest[user_id] = row
+    if not newest:
+        return {}
+
+    values = [
+        {"user_id": user_id, "sensor_log_id": row["id"], **{f: row[f] for f in STATE_FIELDS}}
+        for user_id, row in sorted(newest.items())  # fixed lock order across workers
+    ]
+    if evaluated:
+        for value in values:
+            value["evaluated_log_id"] = value["sensor_log_id"]
+    stmt = dialect_insert(LatestSensorState).values(values)
+    table = LatestSensorState.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "sensor_log_id": stmt.excluded.sensor_log_id,
+            **{f: stmt.excluded[f] for f in STATE_FIELDS},
+            **({"evaluated_log_id": stmt.excluded.evaluated_log_id} if evaluated else {}),
+            "updated_at": func.now(),
+        },
+        where=tuple_(stmt.excluded.timestamp, stmt.excluded.sensor_log_id)
+        > tuple_(table.c.timestamp, table.c.sensor_log_id),
+    ).returning(LatestSensorState.user_id)
+    return {row.user_id: newest[row.user_id] for row in db.execute(stmt)}
+
+
+def latest_reading(db, user_id: int):
+    """The user's newest reading as a LatestSensorState, or None if the device never reported."""
+    return db.get(LatestSensorState, user_id)
+
+
+def latest_readings(db, user_ids=None) -> dict:
+    """user_id -> LatestSensorState for the given users (default: everyone), in one query."""
+    query = db.query(LatestSensorState)
+    if user_ids is not None:
+        query = query.filter(LatestSensorState.user_id.in_(list(user_ids)))
+    return {state.user_id: state for state in query}
+
+
+def rebuild_latest_state(db, user_id: int = None) -> int:
+    """Recompute latest_sensor_state from sensor_logs (after upgrading, or to repair it)."""
+    deleted = db.query(LatestSensorState)
+    if user_id is not None:
+        deleted = deleted.filter(LatestSensorState.user_id == user_id)
+    deleted.delete(synchronize_session=False)
+
+    ranked = select(
+        SensorLog.id, SensorLog.user_id, *[getattr(SensorLog, f) for f in STATE_FIELDS],
+        func.row_number().over(
+            partition_by=SensorLog.user_id, order_by=(SensorLog.timestamp.desc(), SensorLog.id.desc())
+        ).label("rank"),
+    ).where(SensorLog.user_id.isnot(None), SensorLog.timestamp.isnot(None))
+    if user_id is not None:
+        ranked = ranked.where(SensorLog.user_id == user_id)
+    ranked = ranked.subquery()
+
+    newest = select(ranked.c.user_id, ranked.c.id, *[ranked.c[f] for f in STATE_FIELDS]).where(ranked.c.rank == 1)
+    result = db.execute(
+        LatestSensorState.__table__.insert().from_select(["user_id", "sensor_log_id", *STATE_FIELDS], newest)
+    )
+    return max(result.rowcount, 0)
@@ -1,139 +1,66 @@
+import os
 from contextlib import asynccontextmanager
-import pickle
-import joblib
-import json
-import tensorflow as tf
-from tensorflow.keras.layers import InputLayer
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, status
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from .scheduler import check_conditions_job
+from .scheduler import check_conditions_job, release_shards, scheduler_state
 
 from .routers import auth, iot, krishi_saathi, disease
-from .ml import ml_models
+from .ml import ml_models, fertilizer_batcher
+from .model_registry import model_registry, LAZY_MODELS
+from .model_loaders import register_models
 from .manager import manager
-
-# Fix for Keras Version Mismatch (batch_shape vs batch_input_shape)
-class PatchedInputLayer(InputLayer):
-    def __init__(self, *args, **kwargs):
-        if 'batch_shape' in kwargs:
-            kwargs['batch_input_shape'] = kwargs.pop('batch_shape')
-        super().__init__(*args, **kwargs)
+from .pubsub import create_bus
+from .database import SessionLocal
+from . import vectorstores
+from .prediction_cache import prediction_cache
+from .ingest import sensor_buffer
+from .alerts import alert_engine
+from .device_routing import device_routes
+
+# Deprecated: accept /ws/alerts without ?token= (it receives no alerts) so mobile builds that
+# predate token auth stay connected instead of reconnect-looping. Set to 0 once they are gone.
+WS_ALLOW_ANONYMOUS = os.getenv("WS_ALLOW_ANONYMOUS", "1") == "1"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load the ML model
+    # Load the ML models in the background; /health/ready reports when they have settled
+    register_models(model_registry, LAZY_MODELS)
+    model_registry.start()
+    print("🚀 Model loading started in background")
+
+    # Batched sensor_logs writer for /iot/update
+    sensor_buffer.start()
+
+    # Alerts raised in this worker also reach websockets held by the other workers
     try:
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.abspath(os.path.join(current_dir, "../../"))
-        
-        # 1. Load Keras Model (Fertilizer Recommender)
-        model_path = os.path.join(current_dir, "final_model.keras")
-        if os.path.exists(model_path):
-            # compile=False is often safer for inference-only loading to avoid optimizer version mismatches
-            # custom_objects={'InputLayer': PatchedInputLayer} handles the version mismatch
-            ml_models["fertilizer_model"] = tf.keras.models.load_model(
-                model_path, 
-                compile=False,
-                custom_objects={'InputLayer': PatchedInputLayer}
-            )
-            print(f"✅ Keras Fertilizer Model loaded successfully from {model_path}")
-        else:
-            print(f"❌ Model file not found at {model_path}")
-            
-        # 2. Load Preprocessor (Required for Keras model)
-        # Look in current dir first, then project root
-        preprocessor_path = os.path.join(current_dir, "dl_preprocessor.joblib")
-        if not os.path.exists(preprocessor_path):
-             # Fallback to project root (../../dl_preprocessor.joblib)
-             preprocessor_path = os.path.abspath(os.path.join(current_dir, "../../dl_preprocessor.joblib"))
-        
-        if os.path.exists(preprocessor_path):
-            ml_models["preprocessor"] = joblib.load(preprocessor_path)
-            print(f"✅ Preprocessor loaded successfully from {preprocessor_path}")
-        else:
-            print(f"❌ Preprocessor file not found at {preprocessor_path}")
-            ml_models["preprocessor"] = None
-
-        # 3. Load Plant Disease CNN Model
-        # Try backend/app/models/plant_disease_model.h5 or CNN_PLANT_DISEASE/plant_disease_prediction_model.h5
-        cnn_paths = [
-            os.path.join(current_dir, "models", "plant_disease_prediction_model.h5"),
-            os.path.join(current_dir, "models", "plant_disease_model.h5"),
-            os.path.join(project_root, "CNN_PLANT_DISEASE", "plant_disease_prediction_model.h5"),
-            os.path.join(current_dir, "plant_disease_model.h5")
-        ]
-        
-        ml_models["disease_cnn"] = None
-        for path in cnn_paths:
-            if os.path.exists(path):
-                try:
-                    ml_models["disease_cnn"] = tf.keras.models.load_model(path)
-                    print(f"✅ Disease CNN Model loaded from {path}")
-                    break
-                except Exception as e:
-                    print(f"❌ Failed to load Disease CNN from {path}: {e}")
-        
-        if not ml_models["disease_cnn"]:
-            print("⚠️ Disease CNN Model not found. Using GPT-4 Vision fallback.")
-
-        # 4. Load Class Indices
-        indices_paths = [
-            os.path.join(current_dir, "models", "class_indices.json"),
-            os.path.join(project_root, "CNN_PLANT_DISEASE", "class_indices.json")
-        ]
-        
-        ml_models["class_indices"] = None
-        for path in indices_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, "r") as f:
-                        ml_models["class_indices"] = json.load(f)
-                    print(f"✅ Class Indices loaded from {path}")
-                    break
-                except Exception as e:
-                    print(f"❌ Failed to load Class Indices from {path}: {e}")
-        
-        if not ml_models["class_indices"]:
-            print("❌ Class Indices not found in any location.")
-
-        # 5. Load FAISS Index for Disease RAG
-        faiss_path = os.path.join(current_dir, "faiss_disease_index")
-        if os.path.exists(os.path.join(faiss_path, "index.faiss")):
-            try:
-                embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-                ml_models["disease_vectorstore"] = FAISS.load_local(
-                    faiss_path, 
-                    embeddings, 
-                    allow_dangerous_deserialization=True
-                )
-                print(f"✅ Disease FAISS Index loaded from {faiss_path}")
-            except Exception as e:
-                print(f"❌ Failed to load Disease FAISS Index: {e}")
-                ml_models["disease_vectorstore"] = None
-        else:
-            print(f"⚠️ Disease FAISS Index not found at {faiss_path}")
-            ml_models["disease_vectorstore"] = None
-            
+        await manager.start_bus(create_bus())
     except Exception as e:
-        print(f"Error loading ML model: {e}")
-        ml_models["fertilizer_model"] = None
-        ml_models["preprocessor"] = None
-    
+        print(f"⚠️ Alert pub/sub unavailable ({e}); alerts reach this worker's sockets only")
+
     # Start Scheduler
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(check_conditions_job, 'interval', minutes=0.5) # Run every 30 mins
+    scheduler.add_job(check_conditions_job, 'interval', minutes=0.5) # Changed users every 30s, weather every 30 mins
     scheduler.start()
-    print("✅ Scheduler started: Running every 30 minutes.")
+    print("✅ Scheduler started: changed users every 30s, weather every 30 minutes.")
     
     yield
     
     # Clean up
     scheduler.shutdown()
+    try:
+        await run_in_threadpool(release_shards)
+    except Exception as e:
+        print(f"⚠️ Could not release scheduler leases: {e}")
+    # Last flush first: its alerts still need the bus and the sockets
+    await sensor_buffer.stop()
+    await manager.stop_bus()
+    await manager.shutdown()
+    await fertilizer_batcher.stop()
+    model_registry.shutdown()
     ml_models.clear()
 
 app = FastAPI(title="AgniSutra API", version="1.0.0", lifespan=lifespan)
@@ -150,6 +77,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -158,13 +86,84 @@ def read_root():
     return {"message": "Welcome to AgniSutra API (app.main)"}
 
 
+@app.get("/health/live", tags=["root"])
+def liveness():
+    """The process is up and serving requests (models may still be loading)."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["root"])
+def readiness():
+    """503 until every eager model has finished loading (or failed / is missing)."""
+    ready = model_registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "loading", "models": model_registry.status()},
+    )
+
+
+@app.get("/metrics", tags=["root"])
+def read_metrics():
+    """In-process performance counters (batch sizes, queue depth, ...)."""
+    return {
+        "fertilizer_batcher": fertilizer_batcher.stats(),
+        "vectorstores": vectorstores.stats(),
+        "disease_prediction_cache": prediction_cache.stats(),
+        "sensor_ingest": sensor_buffer.stats(),
+        "device_routing": device_routes.stats(),
+        "alert_scheduler": scheduler_state.stats(),
+        "alerts": alert_engine.stats(),
+        "websockets": manager.stats(),
+    }
+
+
+def websocket_user_id(token: str):
+    """Resolve the ?token= of a websocket handshake to a user id (blocking DB lookup)."""
+    db = SessionLocal()
+    try:
+        user = auth.user_from_token(token, db)
+        return user.id if user else None
+    finally:
+        db.close()
+
+
+async def anonymous_websocket(websocket: WebSocket):
+    """Old clients without a token: keep the socket open and answer pings, send no alerts."""
+    client = websocket.client.host if websocket.client else "unknown"
+    print(f"⚠️ Deprecated /ws/alerts connection without token from {client}; it receives no alerts")
+    await websocket.accept()
+    try:
+        while True:
+            if await websocket.receive_text() == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+
+
 @app.websocket("/ws/alerts")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
+    # Alerts are delivered per user, so the socket must say whose it is (same JWT as the REST API)
+    if not token and WS_ALLOW_ANONYMOUS:
+        await anonymous_websocket(websocket)
+        return
+    user_id = await run_in_threadpool(websocket_user_id, token) if token else None
+    if user_id is None:
+        await websocket.accept()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid or missing token")
+        return
+
+    await manager.connect(websocket, user_id)
     try:
         while True:
-            await websocket.receive_text() # Keep connection open
+            # Keep connection open; heartbeats both ways (writes go through the socket's queue)
+            message = await websocket.receive_text()
+            if message == "ping":
+                manager.reply(websocket, "pong")
+            elif message == "pong":
+                manager.pong(websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 
@@ -1,22 +1,266 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
 from fastapi import WebSocket
+from .pubsub import encode_envelopes
+
+# A client that can't take a frame within this long is treated as dead and dropped
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", 5))
+# Outbound messages buffered per socket; when full the oldest queued alert is dropped
+WS_QUEUE_MAX = int(os.getenv("WS_QUEUE_MAX", 32))
+# Every socket gets {"type": "ping"} this often, busy or idle; clients answer with the text "pong"
+WS_PING_INTERVAL_SECONDS = float(os.getenv("WS_PING_INTERVAL_SECONDS", 25))
+# Clients that have answered a ping are dropped if they then stay silent this long
+WS_PONG_TIMEOUT_SECONDS = float(os.getenv("WS_PONG_TIMEOUT_SECONDS", 75))
+
+PING_MESSAGE = json.dumps({"type": "ping"})
+_LATENCY_SAMPLES = 1000
+
+
+class ClientConnection:
+    """One socket's bounded outbound queue, drained by its own writer task."""
+
+    def __init__(self, websocket: WebSocket, user_id: int, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        self.pending = deque()  # (enqueued_at, message)
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.last_pong = None  # monotonic time of the last "pong"; None until the client answers one
+        self.last_ping = time.monotonic()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: str) -> bool:
+        """Queue without waiting. Duplicates of a still-queued message are coalesced; when full the oldest goes."""
+        if self.closed:
+            return False
+        if any(queued == message for _, queued in self.pending):
+            self.manager.coalesced += 1
+            return True
+        if len(self.pending) >= WS_QUEUE_MAX:
+            self.pending.popleft()
+            self.manager.dropped += 1
+        self.pending.append((time.monotonic(), message))
+        self.manager.enqueued += 1
+        self.ready.set()
+        return True
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def heartbeat_expired(self) -> bool:
+        return self.last_pong is not None and time.monotonic() - self.last_pong > WS_PONG_TIMEOUT_SECONDS
+
+    async def _writer(self):
+        manager = self.manager
+        try:
+            while not self.closed:
+                next_ping = self.last_ping + WS_PING_INTERVAL_SECONDS - time.monotonic()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), max(next_ping, 0))
+                except asyncio.TimeoutError:
+                    pass
+                self.ready.clear()
+                # On every pass, not only when idle: a steady stream of alerts must not keep a dead client
+                if self.heartbeat_expired():
+                    manager.heartbeat_timeouts += 1
+                    break
+                now = time.monotonic()
+                if now - self.last_ping >= WS_PING_INTERVAL_SECONDS:
+                    self.pending.append((now, PING_MESSAGE))
+                    self.last_ping = now
+                    manager.pings += 1
+                while self.pending and not self.closed:
+                    enqueued_at, message = self.pending.popleft()
+                    await asyncio.wait_for(self.websocket.send_text(message), WS_SEND_TIMEOUT_SECONDS)
+                    manager.sent += 1
+                    manager.latencies.append(time.monotonic() - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Closed or stuck client
+            manager.failed += 1
+        finally:
+            if not self.closed:
+                manager.prune(self)
+
 
 class ConnectionManager:
+    """
+    Open /ws/alerts sockets, indexed by the authenticated user they belong to. With a pub/sub
+    bus attached, every send is also published once so other workers deliver to their sockets.
+    """
+
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.origin = uuid.uuid4().hex  # tags this worker's publications
+        self.bus = None
+        self.publish_failures = 0
+        self.remote_messages = 0
+        self.connections: dict[int, set[ClientConnection]] = {}  # user_id -> that user's sockets (tabs, devices)
+        self.clients: dict[WebSocket, ClientConnection] = {}
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.pruned = 0
+        self.pings = 0
+        self.heartbeat_timeouts = 0
+        self.latencies = deque(maxlen=_LATENCY_SAMPLES)  # enqueue -> sent, seconds
+        self._closing = set()  # close() tasks of pruned sockets (kept referenced until done)
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, user_id, self)
+        self.connections.setdefault(user_id, set()).add(client)
+        self.clients[websocket] = client
+        client.start()
+        return client
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # Handle disconnected clients gracefully if remove didn't happen yet
-                pass
+        """Forget the socket and stop its writer; safe to call more than once."""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        client.close()
+        sockets = self.connections.get(client.user_id)
+        if sockets is not None:
+            sockets.discard(client)
+            if not sockets:
+                del self.connections[client.user_id]
+
+    def prune(self, client: ClientConnection):
+        """Drop a dead or stuck client and close its socket in the background."""
+        if client.websocket not in self.clients:
+            return
+        self.pruned += 1
+        self.disconnect(client.websocket)
+        task = asyncio.create_task(self._close(client.websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(), WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def reply(self, websocket: WebSocket, message: str):
+        """Queue a direct reply (e.g. "pong") behind the socket's pending alerts."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.enqueue(message)
+
+    def pong(self, websocket: WebSocket):
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.last_pong = time.monotonic()
+
+    def _enqueue_users(self, messages) -> int:
+        return sum(
+            client.enqueue(message)
+            for user_id, message in messages
+            for client in list(self.connections.get(user_id, ()))
+        )
+
+    def _enqueue_all(self, message: str) -> int:
+        return sum(client.enqueue(message) for client in list(self.clients.values()))
+
+    async def _publish(self, deliveries=None, broadcast: str = None):
+        if self.bus is None:
+            return
+        try:
+            for payload in encode_envelopes(self.origin, deliveries, broadcast, self.bus.max_payload):
+                await self.bus.publish(payload)
+        except Exception as e:
+            # Local sockets already have it; only other workers' sockets miss this alert
+            self.publish_failures += 1
+            print(f"⚠️ Could not publish alert to other workers: {e}")
+
+    async def send_to_user(self, user_id: int, message: str) -> int:
+        """Queue for every local socket of one user and publish to other workers; returns local sockets queued to."""
+        return await self.send_to_users([(user_id, message)])
+
+    async def send_to_users(self, messages) -> int:
+        """Queue many (user_id, message) pairs at once; users without an open socket are skipped."""
+        messages = list(messages)
+        queued = self._enqueue_users(messages)
+        await self._publish(deliveries=messages)
+        return queued
+
+    async def broadcast(self, message: str) -> int:
+        """Queue for every connected socket (announcements; per-user alerts go through send_to_user)."""
+        queued = self._enqueue_all(message)
+        await self._publish(broadcast=message)
+        return queued
+
+    def _on_bus_message(self, payload: str):
+        envelope = json.loads(payload)
+        if envelope.get("o") == self.origin:
+            return
+        self.remote_messages += 1
+        if "b" in envelope:
+            self._enqueue_all(envelope["b"])
+        else:
+            self._enqueue_users(envelope.get("u", ()))
+
+    async def start_bus(self, bus):
+        """Attach a pub/sub bus (app startup)."""
+        await bus.start(self._on_bus_message)
+        self.bus = bus
+
+    async def stop_bus(self):
+        bus, self.bus = self.bus, None
+        if bus is not None:
+            await bus.stop()
+
+    async def shutdown(self):
+        """Stop every writer (server shutdown)."""
+        clients = list(self.clients.values())
+        for client in clients:
+            self.disconnect(client.websocket)
+        tasks = [client.task for client in clients if client.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *self._closing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        depths = [len(client.pending) for client in self.clients.values()]
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2) if latencies else None
+
+        return {
+            "users": len(self.connections),
+            "sockets": len(self.clients),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "pruned": self.pruned,
+            "pings": self.pings,
+            "heartbeat_timeouts": self.heartbeat_timeouts,
+            "send_latency_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "samples": len(latencies)},
+            "remote_messages": self.remote_messages,
+            "publish_failures": self.publish_failures,
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
 
 manager = ConnectionManager()
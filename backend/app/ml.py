@@ -1,2 +1,208 @@
+import os
+import time
+import asyncio
+import numpy as np
+import pandas as pd
+
 # Global dictionary to store ML models
 ml_models = {}
+
+# Request field -> training column, in the order the preprocessor was fitted with:
+# ['crop', 'yield_t_ha', 'soil_N_status_kg_ha', 'soil_P_status_kg_ha', 'soil_K_status_kg_ha', 'mean_temp_gs_C', 'soil_pH', 'soil_moisture_pct']
+FERTILIZER_COLUMNS = {
+    "crop": "crop",
+    "target_yield": "yield_t_ha",
+    "soil_N": "soil_N_status_kg_ha",
+    "soil_P": "soil_P_status_kg_ha",
+    "soil_K": "soil_K_status_kg_ha",
+    "temperature": "mean_temp_gs_C",
+    "ph": "soil_pH",
+    "moisture": "soil_moisture_pct",
+}
+
+
+def fertilizer_frame(rows) -> pd.DataFrame:
+    """
+    Build the preprocessor input DataFrame for a list of FertilizerRecommendationInput rows.
+    """
+    return pd.DataFrame({
+        column: [getattr(row, field) for row in rows]
+        for field, column in FERTILIZER_COLUMNS.items()
+    })
+
+
+def fertilizer_components():
+    """(model, preprocessor), or RuntimeError if either failed to load."""
+    model = ml_models.get("fertilizer_model")
+    preprocessor = ml_models.get("preprocessor")
+    if not model:
+        raise RuntimeError("Fertilizer Model not loaded")
+    if not preprocessor:
+        raise RuntimeError("Preprocessor not loaded")
+    return model, preprocessor
+
+
+def predict_fertilizer(df: pd.DataFrame) -> np.ndarray:
+    """
+    Run one preprocessor pass and one model call over every row of `df`.
+    Returns an (n, 3) array of non-negative [N, P, K] recommendations.
+    """
+    model, preprocessor = fertilizer_components()
+    X_transformed = preprocessor.transform(df)
+    prediction = model.predict(X_transformed, batch_size=min(len(df), 1024), verbose=0)
+    return np.maximum(np.asarray(prediction, dtype=np.float64), 0.0)
+
+
+def _score_fertilizer_rows(rows: list) -> list:
+    model, _ = fertilizer_components()
+    if hasattr(model, "predict_rows"):
+        # NumPy engine: encode straight from the request objects, no DataFrame round trip
+        return list(np.maximum(model.predict_rows(rows, FERTILIZER_COLUMNS), 0.0))
+    return list(predict_fertilizer(fertilizer_frame(rows)))
+
+
+def predict_fertilizer_rows(rows: list) -> list:
+    """
+    Score a list of FertilizerRecommendationInput rows with one model call.
+    If the batch call fails, it is split in halves and only a failing half is split
+    again, so the offending rows come back as an Exception instead of an [N, P, K]
+    array at O(bad rows x log n) extra calls. A model that isn't loaded fails every
+    row at once, without retries.
+    """
+    if not rows:
+        return []
+    try:
+        fertilizer_components()
+    except RuntimeError as e:
+        return [e] * len(rows)
+    try:
+        return _score_fertilizer_rows(rows)
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+        mid = len(rows) // 2
+        return predict_fertilizer_rows(rows[:mid]) + predict_fertilizer_rows(rows[mid:])
+
+
+class MicroBatcher:
+    """
+    Shared in-process inference queue that merges concurrent single requests into one
+    model call. A batch is dispatched once it holds `max_batch_size` items or the first
+    item has waited `max_wait_ms`. `predict_batch` runs in the default thread pool, takes
+    a list of inputs and returns one output (or Exception) per input.
+    """
+
+    def __init__(self, predict_batch, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.total_predict_seconds = 0.0
+        # Power-of-two buckets: "1", "2", "4", ... -> number of batches of at most that size
+        self.batch_size_histogram = {}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, item):
+        """
+        Queue one input and wait for its prediction.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Drop requests whose caller has already gone away
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            bucket = 1
+            while bucket < len(batch):
+                bucket *= 2
+            self.batch_size_histogram[str(bucket)] = self.batch_size_histogram.get(str(bucket), 0) + 1
+
+            started = time.perf_counter()
+            try:
+                outputs = await loop.run_in_executor(None, self.predict_batch, [item for item, _ in batch])
+            except Exception as e:
+                outputs = [e] * len(batch)
+            self.total_predict_seconds += time.perf_counter() - started
+
+            for (_, future), output in zip(batch, outputs):
+                if future.done():
+                    continue
+                if isinstance(output, Exception):
+                    self.errors += 1
+                    future.set_exception(output)
+                else:
+                    future.set_result(output)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "mean_predict_ms": round(1000.0 * self.total_predict_seconds / self.batches, 3) if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items(), key=lambda kv: int(kv[0]))),
+        }
+
+
+fertilizer_batcher = MicroBatcher(
+    predict_fertilizer_rows,
+    max_batch_size=int(os.getenv("FERTILIZER_BATCH_MAX_SIZE", 32)),
+    max_wait_ms=float(os.getenv("FERTILIZER_BATCH_MAX_WAIT_MS", 2)),
+)
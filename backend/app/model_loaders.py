@@ -0,0 +1,162 @@
+import os
+import json
+import joblib
+
+from .ml import ml_models
+from .fertilizer_engine import NumpyFertilizerModel
+from .disease_backends import BACKENDS as DISEASE_BACKENDS
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, "../../"))
+
+# Which fertilizer backend to serve: "auto" prefers the exported NumPy weights when present
+FERTILIZER_BACKEND = os.getenv("FERTILIZER_BACKEND", "auto")
+
+# Try backend/app/models/plant_disease_model.h5 or CNN_PLANT_DISEASE/plant_disease_prediction_model.h5
+DISEASE_CNN_PATHS = [
+    os.path.join(current_dir, "models", "plant_disease_prediction_model.h5"),
+    os.path.join(current_dir, "models", "plant_disease_model.h5"),
+    os.path.join(project_root, "CNN_PLANT_DISEASE", "plant_disease_prediction_model.h5"),
+    os.path.join(current_dir, "plant_disease_model.h5")
+]
+# Which disease CNN runtime to serve: "auto" prefers converted models (convert_disease_model.py)
+# found next to the .h5, in this order
+DISEASE_BACKEND = os.getenv("DISEASE_BACKEND", "auto")
+DISEASE_BACKEND_FILES = [("onnx", ".onnx"), ("tflite", ".tflite"), ("keras", ".h5")]
+
+
+def load_keras_model(path, **kwargs):
+    # TensorFlow is imported lazily so workers that only serve the NumPy model never load it
+    import tensorflow as tf
+    from tensorflow.keras.layers import InputLayer
+
+    # Fix for Keras Version Mismatch (batch_shape vs batch_input_shape)
+    class PatchedInputLayer(InputLayer):
+        def __init__(self, *args, **kwargs):
+            if 'batch_shape' in kwargs:
+                kwargs['batch_input_shape'] = kwargs.pop('batch_shape')
+            super().__init__(*args, **kwargs)
+
+    return tf.keras.models.load_model(path, custom_objects={'InputLayer': PatchedInputLayer}, **kwargs)
+
+
+def load_fertilizer_model() -> bool:
+    """Fertilizer Recommender + its preprocessor (fills `fertilizer_model` and `preprocessor`)."""
+    # The NumPy engine (export_fertilizer_npz.py) bundles the MLP weights and the preprocessor,
+    # so it fills both slots and TensorFlow is never imported for this model.
+    npz_path = os.path.join(current_dir, "fertilizer_mlp.npz")
+    model_path = os.path.join(current_dir, "final_model.keras")
+    if FERTILIZER_BACKEND != "keras" and os.path.exists(npz_path):
+        engine = NumpyFertilizerModel(npz_path)
+        ml_models["preprocessor"] = engine
+        ml_models["fertilizer_model"] = engine
+        print(f"✅ NumPy Fertilizer Model loaded successfully from {npz_path}")
+        return True
+
+    # Preprocessor (Required for Keras model)
+    # Look in current dir first, then project root
+    preprocessor_path = os.path.join(current_dir, "dl_preprocessor.joblib")
+    if not os.path.exists(preprocessor_path):
+        # Fallback to project root (../../dl_preprocessor.joblib)
+        preprocessor_path = os.path.abspath(os.path.join(current_dir, "../../dl_preprocessor.joblib"))
+
+    if os.path.exists(preprocessor_path):
+        ml_models["preprocessor"] = joblib.load(preprocessor_path)
+        print(f"✅ Preprocessor loaded successfully from {preprocessor_path}")
+    else:
+        print(f"❌ Preprocessor file not found at {preprocessor_path}")
+        ml_models["preprocessor"] = None
+
+    if not os.path.exists(model_path):
+        print(f"❌ Model file not found at {model_path}")
+        return False
+    # compile=False is often safer for inference-only loading to avoid optimizer version mismatches
+    ml_models["fertilizer_model"] = load_keras_model(model_path, compile=False)
+    print(f"✅ Keras Fertilizer Model loaded successfully from {model_path}")
+    return True
+
+
+def load_disease_cnn() -> bool:
+    ml_models["disease_cnn"] = None
+    for path in DISEASE_CNN_PATHS:
+        stem = os.path.splitext(path)[0]
+        for backend, ext in DISEASE_BACKEND_FILES:
+            candidate = stem + ext
+            if DISEASE_BACKEND not in ("auto", backend) or not os.path.exists(candidate):
+                continue
+            try:
+                if backend == "keras":
+                    ml_models["disease_cnn"] = load_keras_model(candidate)
+                else:
+                    ml_models["disease_cnn"] = DISEASE_BACKENDS[backend](candidate)
+                print(f"✅ Disease CNN Model ({backend}) loaded from {candidate}")
+                return True
+            except Exception as e:
+                print(f"❌ Failed to load Disease CNN from {candidate}: {e}")
+
+    print("⚠️ Disease CNN Model not found. Using GPT-4 Vision fallback.")
+    return False
+
+
+def load_class_indices() -> bool:
+    indices_paths = [
+        os.path.join(current_dir, "models", "class_indices.json"),
+        os.path.join(project_root, "CNN_PLANT_DISEASE", "class_indices.json")
+    ]
+
+    ml_models["class_indices"] = None
+    for path in indices_paths:
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    ml_models["class_indices"] = json.load(f)
+                print(f"✅ Class Indices loaded from {path}")
+                return True
+            except Exception as e:
+                print(f"❌ Failed to load Class Indices from {path}: {e}")
+
+    print("❌ Class Indices not found in any location.")
+    return False
+
+
+def load_disease_vectorstore() -> bool:
+    """FAISS Index for Disease RAG."""
+    from .vectorstores import load_faiss_index, get_index_version, DISEASE_EMBEDDING_MODEL, DISEASE_INDEX_DIR
+    from .advisory_store import purge_stale_advisories
+
+    faiss_path = DISEASE_INDEX_DIR
+    ml_models["disease_vectorstore"] = None
+    if not os.path.exists(os.path.join(faiss_path, "index.faiss")):
+        print(f"⚠️ Disease FAISS Index not found at {faiss_path}")
+        return False
+
+    ml_models["disease_vectorstore"] = load_faiss_index(faiss_path, DISEASE_EMBEDDING_MODEL)
+
+    # Advisories generated from a previous build of the index are no longer valid
+    try:
+        removed = purge_stale_advisories(get_index_version(faiss_path))
+        if removed:
+            print(f"🧹 Removed {removed} stale disease advisories")
+    except Exception as e:
+        print(f"⚠️ Could not purge stale disease advisories: {e}")
+    return True
+
+
+def load_krishi_advisor() -> bool:
+    """Krishi Saathi RAG chain (oilseed embeddings + FAISS index + LLM client)."""
+    from .krishi_saathi_llm import KrishiSaathiAdvisor
+
+    ml_models["krishi_advisor"] = KrishiSaathiAdvisor()
+    print("✅ Krishi Saathi Advisor initialized!")
+    return True
+
+
+def register_models(registry, lazy_models=()):
+    for name, loader in [
+        ("fertilizer_model", load_fertilizer_model),
+        ("disease_cnn", load_disease_cnn),
+        ("class_indices", load_class_indices),
+        ("disease_vectorstore", load_disease_vectorstore),
+        ("krishi_advisor", load_krishi_advisor),
+    ]:
+        registry.register(name, loader, lazy=name in lazy_models)
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .ml import ml_models
+
+
+class ModelRegistry:
+    """
+    Loads models on a thread pool instead of blocking the lifespan.
+
+    Each loader fills its slot(s) in `ml_models` itself and returns False when its
+    artifact is simply not present (the app then uses its existing fallbacks).
+    Eager models start loading as soon as `start()` is called; lazy ones start on
+    the first `ensure()`. Request handlers call `ensure()` / `ensure_async()` to
+    wait (bounded) for a model that is still loading.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._started_at = None
+
+    def register(self, name: str, loader, lazy: bool = False):
+        self._entries[name] = {
+            "loader": loader,
+            "lazy": lazy,
+            "state": "pending",
+            "future": None,
+            "seconds": None,
+            "error": None,
+        }
+
+    def _load(self, name: str):
+        entry = self._entries[name]
+        entry["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            found = entry["loader"]()
+            entry["state"] = "ready" if found is not False else "missing"
+        except Exception as e:
+            entry["state"] = "failed"
+            entry["error"] = str(e)
+            print(f"❌ Failed to load {name}: {e}")
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        print(f"⏱️ {name}: {entry['state']} in {entry['seconds']:.2f}s")
+
+        if self._started_at is not None and self.is_ready():
+            total, self._started_at = time.perf_counter() - self._started_at, None
+            print(f"✅ All eager models settled {total:.2f}s after startup")
+
+    def _submit(self, name: str):
+        with self._lock:
+            entry = self._entries[name]
+            if entry["future"] is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-loader")
+                entry["future"] = self._executor.submit(self._load, name)
+            return entry["future"]
+
+    def start(self):
+        """Kick off background loading of every eager model and return immediately."""
+        self._started_at = time.perf_counter()
+        for name, entry in self._entries.items():
+            if not entry["lazy"]:
+                self._submit(name)
+
+    def ensure(self, name: str, timeout: float = None):
+        """
+        Start loading `name` if needed and wait up to `timeout` seconds for it (None = don't wait).
+        Returns the model from `ml_models`, or None if it is not available (yet).
+        """
+        if name in self._entries:
+            future = self._submit(name)
+            if timeout:
+                try:
+                    future.result(timeout=timeout)
+                except Exception:
+                    pass
+        return ml_models.get(name)
+
+    async def ensure_async(self, name: str, timeout: float = None):
+        """Same as `ensure`, without blocking the event loop while waiting."""
+        if name in self._entries:
+            future = self._submit(name)
+            if timeout:
+                try:
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+                except Exception:
+                    pass
+        return ml_models.get(name)
+
+    def is_ready(self) -> bool:
+        """Ready once every eager model has settled (loaded, missing or failed)."""
+        return all(
+            entry["state"] not in ("pending", "loading")
+            for entry in self._entries.values()
+            if not entry["lazy"]
+        )
+
+    def status(self) -> dict:
+        return {
+            name: {
+                "state": entry["state"],
+                "lazy": entry["lazy"],
+                "load_seconds": entry["seconds"],
+                "error": entry["error"],
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for entry in self._entries.values():
+            entry.update(state="pending", future=None, seconds=None, error=None)
+
+
+# Comma-separated registry names that load on first use instead of at startup, e.g. "krishi_advisor"
+LAZY_MODELS = {name.strip() for name in os.getenv("LAZY_MODELS", "").split(",") if name.strip()}
+# How long a request waits for a model that is still loading before using its fallback
+MODEL_WAIT_SECONDS = float(os.getenv("MODEL_WAIT_SECONDS", 30))
+
+model_registry = ModelRegistry(max_workers=int(os.getenv("MODEL_LOADER_THREADS", 4)))
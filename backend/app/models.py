@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, func, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, func, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -24,14 +24,20 @@ class User(Base):
     lon = Column(Float, nullable=True)
 
     # IoT Configuration
-    device_id = Column(String, nullable=True) # e.g., MAC Address of ESP32
+    device_id = Column(String, nullable=True, index=True) # e.g., MAC Address of ESP32
 
 
 class SensorLog(Base):
     __tablename__ = "sensor_logs"
+    __table_args__ = (
+        # Makes device uploads idempotent: a re-sent reading is the same (device, time, user) row.
+        # A unique index rather than a constraint so it can be added to existing tables.
+        Index("uq_sensor_logs_device_ts", "device_id", "timestamp", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    device_id = Column(String, nullable=True)
     
     # Soil Nutrients
     nitrogen = Column(Float, nullable=True)
@@ -48,6 +54,87 @@ class SensorLog(Base):
     user = relationship("User", backref="sensor_logs")
 
 
+# Newest-first reads per user (/iot/my-logs pages, latest reading) walk this index instead of sorting
+Index("ix_sensor_logs_user_ts_id", SensorLog.user_id, SensorLog.timestamp.desc(), SensorLog.id.desc())
+
+
+class LatestSensorState(Base):
+    """Newest reading per user, upserted on ingest so latest-reading lookups never scan sensor_logs."""
+    __tablename__ = "latest_sensor_state"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    sensor_log_id = Column(Integer, nullable=False)  # id of the SensorLog row this mirrors
+    device_id = Column(String, nullable=True)
+
+    nitrogen = Column(Float, nullable=True)
+    phosphorus = Column(Float, nullable=True)
+    potassium = Column(Float, nullable=True)
+    moisture = Column(Float)
+    temperature = Column(Float, nullable=True)
+    humidity = Column(Float, nullable=True)
+
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # sensor_log_id the alert scheduler last evaluated; differs from sensor_log_id while a new reading is pending
+    evaluated_log_id = Column(Integer, nullable=True)
+
+
+class SchedulerLease(Base):
+    """One row per alert-scheduler shard; the worker holding an unexpired lease evaluates that shard's users."""
+    __tablename__ = "scheduler_leases"
+
+    shard = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=True)  # "<host>:<pid>:<nonce>" of the holding worker
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    weather_checked_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class SensorRollup(Base):
+    """Per-user count/sum/min/max of one sensor metric over a 1m, 1h or 1d bucket, maintained on ingest."""
+    __tablename__ = "sensor_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "metric", "resolution", "bucket_start", name="uq_sensor_rollup_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    metric = Column(String, nullable=False)      # e.g. "moisture"
+    resolution = Column(String, nullable=False)  # "1m", "1h", "1d"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    min_value = Column(Float, nullable=True)
+    max_value = Column(Float, nullable=True)
+
+
+class AlertState(Base):
+    """Current state of one alert type for one user (app/alerts.py state machine)."""
+    __tablename__ = "alert_states"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    alert_type = Column(String, primary_key=True)  # e.g. "moisture_low", "weather_storm"
+    active = Column(Integer, nullable=False, default=0)  # 0: clear, 1: raised
+    value = Column(Float, nullable=True)  # reading that caused the last change
+    changed_at = Column(DateTime(timezone=True), nullable=True)
+    last_notified_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AlertEvent(Base):
+    """History of alert state changes and notifications, written in bulk."""
+    __tablename__ = "alert_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    alert_type = Column(String, nullable=False)
+    event = Column(String, nullable=False)  # "raised", "repeated", "cleared"
+    value = Column(Float, nullable=True)
+    message = Column(Text, nullable=True)  # what was sent; null if nothing was (cleared, or within cooldown)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+Index("ix_alert_events_user_created", AlertEvent.user_id, AlertEvent.created_at)
+
+
 class Field(Base):
     __tablename__ = "fields"
 
@@ -74,3 +161,18 @@ class YieldRecord(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", backref="yields")
+
+
+class DiseaseAdvisory(Base):
+    """RAG advisory generated for a predicted disease class, reused until the index changes or the TTL expires."""
+    __tablename__ = "disease_advisories"
+    __table_args__ = (
+        UniqueConstraint("disease_class", "language", "index_version", name="uq_disease_advisory_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    disease_class = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    index_version = Column(String, nullable=False, index=True)
+    advice = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,113 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+from .cache import LRUCache
+from .image_preprocessing import validate_upload
+
+# Finished /disease/predict results, keyed by upload content + request context
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 512))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 24 * 3600)) or None
+# Max differing bits (of 64) for two dHashes to count as the same photo (re-encoded, resized, ...).
+# 0 only matches identical dHashes; larger values risk matching a different leaf with a similar
+# composition. -1 turns the near-duplicate lookup off.
+PERCEPTUAL_HASH_MAX_DISTANCE = int(os.getenv("PERCEPTUAL_HASH_MAX_DISTANCE", 0))
+
+
+def content_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def perceptual_hash(file_bytes: bytes) -> int:
+    """
+    64-bit difference hash: 9x8 grayscale thumbnail, one bit per horizontal neighbour
+    comparison. Stable under re-compression and resizing, so a photo re-sent through a
+    messaging app still matches.
+    """
+    img = validate_upload(file_bytes)
+    img.draft("L", (9, 8))
+    pixels = list(img.convert("L").resize((9, 8), resample=Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return value
+
+
+class PredictionCache:
+    """
+    Exact-match LRU keyed by (sha256, crop, language, query), plus a near-duplicate index
+    of perceptual hashes scanned linearly within the same (crop, language, query) context.
+    The scan is bounded by the cache size, so it stays in the microseconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None, max_distance: int = 0):
+        self.results = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.max_distance = max_distance
+        self._phashes = OrderedDict()  # exact key -> perceptual hash
+        self._lock = threading.Lock()
+        self.near_hits = 0
+        self.hash_failures = 0
+
+    @staticmethod
+    def _context(crop_name: str, language: str, query: str) -> tuple:
+        return ((crop_name or "").strip().lower(), (language or "en").strip().lower(), (query or "").strip())
+
+    def lookup(self, file_bytes: bytes, crop_name: str, language: str, query: str):
+        """
+        Returns (key, phash, result, match); match is "exact", "near_duplicate" or None on a
+        miss. Pass key and phash back to put(). Blocking (hashing/decoding); call from the thread pool.
+        """
+        key = (content_hash(file_bytes),) + self._context(crop_name, language, query)
+        result = self.results.get(key)
+        if result is not None:
+            return key, None, result, "exact"
+        if self.max_distance < 0:
+            return key, None, None, None
+
+        try:
+            phash = perceptual_hash(file_bytes)
+        except Exception:
+            # Undecodable here (truncated, unusual encoding): leave it to the analysis, exact key only
+            self.hash_failures += 1
+            return key, None, None, None
+        with self._lock:
+            candidates = [
+                (other, other_hash) for other, other_hash in self._phashes.items()
+                if other[1:] == key[1:] and bin(other_hash ^ phash).count("1") <= self.max_distance
+            ]
+        for other, _ in candidates:
+            result = self.results.get(other)
+            if result is not None:
+                self.near_hits += 1
+                self.put(key, phash, result)  # the next exact retry skips the decode
+                return key, phash, result, "near_duplicate"
+        return key, phash, None, None
+
+    def put(self, key: tuple, phash: int, result: dict):
+        self.results.put(key, result)
+        if phash is None:
+            return
+        with self._lock:
+            self._phashes[key] = phash
+            self._phashes.move_to_end(key)
+            while len(self._phashes) > self.results.maxsize:
+                self._phashes.popitem(last=False)
+
+    def clear(self):
+        self.results.clear()
+        with self._lock:
+            self._phashes.clear()
+
+    def stats(self) -> dict:
+        return {**self.results.stats(), "near_duplicate_hits": self.near_hits,
+                "max_distance": self.max_distance, "hash_failures": self.hash_failures}
+
+
+prediction_cache = PredictionCache(
+    maxsize=PREDICTION_CACHE_SIZE,
+    ttl=PREDICTION_CACHE_TTL_SECONDS,
+    max_distance=PERCEPTUAL_HASH_MAX_DISTANCE,
+)
@@ -0,0 +1,363 @@
+import os
+import re
+import glob
+import json
+import uuid
+import socket
+import asyncio
+from abc import ABC, abstractmethod
+from starlette.concurrency import run_in_threadpool
+
+# How alert deliveries reach sockets held by other uvicorn workers:
+#   memory   - single process only (dev, one worker)
+#   unix     - datagrams between the workers of one host, no extra services
+#   postgres - LISTEN/NOTIFY on the app database; works across hosts
+#   redis    - Redis PUBLISH/SUBSCRIBE (needs the `redis` package and REDIS_URL)
+#   auto     - postgres when DATABASE_URL is PostgreSQL, else memory
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "auto").lower()
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "agnisutra_alerts")
+PUBSUB_SOCKET_DIR = os.getenv("PUBSUB_SOCKET_DIR", "/tmp/agnisutra-alerts")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PUBSUB_RECONNECT_SECONDS = float(os.getenv("PUBSUB_RECONNECT_SECONDS", 2))
+# The first LISTEN connection gives up after this long, so startup can fall back to local-only
+PUBSUB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("PUBSUB_CONNECT_TIMEOUT_SECONDS", 5))
+# How long a unix publish waits on a worker whose receive buffer is full before dropping
+UNIX_SEND_WAIT_SECONDS = float(os.getenv("PUBSUB_UNIX_SEND_WAIT_SECONDS", 1))
+
+
+def encode_envelopes(origin: str, deliveries=None, broadcast: str = None, max_payload: int = None) -> list:
+    """
+    Pack (user_id, message) deliveries (or one broadcast) into JSON payloads, split so that
+    none exceeds the backend's payload limit. A single delivery over the limit is dropped.
+    """
+    if broadcast is not None:
+        payload = json.dumps({"o": origin, "b": broadcast})
+        return [payload] if max_payload is None or len(payload.encode()) <= max_payload else []
+
+    payloads, batch, size = [], [], 0
+    overhead = len(json.dumps({"o": origin, "u": []}).encode())
+    for user_id, message in deliveries:
+        item = [user_id, message]
+        item_size = len(json.dumps(item).encode()) + 2
+        if max_payload is not None:
+            if overhead + item_size > max_payload:
+                print(f"⚠️ Alert for user {user_id} too large for the pub/sub bus; delivered locally only")
+                continue
+            if batch and overhead + size + item_size > max_payload:
+                payloads.append(json.dumps({"o": origin, "u": batch}))
+                batch, size = [], 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        payloads.append(json.dumps({"o": origin, "u": batch}))
+    return payloads
+
+
+class PubSubBus(ABC):
+    """Fan-out of raw payloads to every other worker subscribed to the channel."""
+
+    name = "base"
+    max_payload = None  # bytes per payload, None if unlimited
+
+    def __init__(self, channel: str = PUBSUB_CHANNEL):
+        self.channel = channel
+        self.handler = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self, handler):
+        """Begin calling handler(payload: str) on the event loop for payloads from other workers."""
+        self.handler = handler
+
+    @abstractmethod
+    async def publish(self, payload: str):
+        """Send the payload to the other workers."""
+
+    async def stop(self):
+        self.handler = None
+
+    def _deliver(self, payload: str):
+        self.received += 1
+        try:
+            self.handler(payload)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Pub/sub message handling failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "channel": self.channel,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+_LOCAL_SUBSCRIBERS: dict[str, list] = {}
+
+
+class InProcessBus(PubSubBus):
+    """Buses in the same process (several managers, tests); nothing crosses process boundaries."""
+
+    name = "memory"
+
+    async def start(self, handler):
+        await super().start(handler)
+        _LOCAL_SUBSCRIBERS.setdefault(self.channel, []).append(self)
+
+    async def publish(self, payload: str):
+        self.published += 1
+        for bus in list(_LOCAL_SUBSCRIBERS.get(self.channel, ())):
+            if bus is not self:
+                bus._deliver(payload)
+
+    async def stop(self):
+        subscribers = _LOCAL_SUBSCRIBERS.get(self.channel, [])
+        if self in subscribers:
+            subscribers.remove(self)
+        await super().stop()
+
+
+class UnixSocketBus(PubSubBus):
+    """
+    Each worker binds a datagram socket in PUBSUB_SOCKET_DIR and publishes by sending to every
+    other socket there. Sockets left behind by crashed workers are removed on first failed send.
+    """
+
+    name = "unix"
+    max_payload = 60_000
+
+    def __init__(self, channel: str = PUBSUB_CHANNEL, directory: str = PUBSUB_SOCKET_DIR):
+        super().__init__(channel)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{channel}-{os.getpid()}-{uuid.uuid4().hex[:6]}.sock")
+        self.sock = None
+        self.dropped = 0
+
+    async def start(self, handler):
+        await super().start(handler)
+        os.makedirs(self.directory, exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Room for a scheduler pass worth of alerts (the kernel caps this at net.core.rmem_max)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(self.max_payload)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.errors += 1
+                return
+            self._deliver(data.decode())
+
+    async def publish(self, payload: str):
+        data = payload.encode()
+        for path in glob.glob(os.path.join(self.directory, f"{self.channel}-*.sock")):
+            if path == self.path:
+                continue
+            try:
+                try:
+                    self.sock.sendto(data, path)
+                except BlockingIOError:
+                    # Its receive buffer is full: give it a moment to catch up
+                    await asyncio.wait_for(
+                        asyncio.get_running_loop().sock_sendto(self.sock, data, path), UNIX_SEND_WAIT_SECONDS
+                    )
+                self.published += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)  # its worker is gone
+                except OSError:
+                    pass
+            except asyncio.TimeoutError:
+                self.dropped += 1  # that worker is stuck
+            except OSError:
+                self.errors += 1
+
+    async def stop(self):
+        if self.sock is not None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        await super().stop()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "dropped": self.dropped}
+
+
+class PostgresBus(PubSubBus):
+    """LISTEN on a dedicated psycopg2 connection, NOTIFY through the app's engine."""
+
+    name = "postgres"
+    max_payload = 7900  # NOTIFY payloads must stay under 8000 bytes
+
+    def __init__(self, engine, channel: str = PUBSUB_CHANNEL):
+        super().__init__(channel)
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", channel):
+            raise ValueError(f"Invalid PostgreSQL channel name: {channel!r}")
+        self.engine = engine
+        self.conn = None
+        self.loop = None
+        self.reconnect_task = None
+        self.stopped = False
+
+    def _dsn(self) -> str:
+        return self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def _listen(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self._dsn(), connect_timeout=PUBSUB_CONNECT_TIMEOUT_SECONDS)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    async def start(self, handler):
+        """Connect and LISTEN; raises if that fails (no driver, DB down) so the caller can fall back."""
+        await super().start(handler)
+        self.loop = asyncio.get_running_loop()
+        self.stopped = False
+        self.conn = await run_in_threadpool(self._listen)
+        self.loop.add_reader(self.conn.fileno(), self._on_readable)
+
+    async def _reconnect(self):
+        """After a dropped connection: retry until it is back or the bus is stopped."""
+        while not self.stopped:
+            try:
+                self.conn = await run_in_threadpool(self._listen)
+                self.loop.add_reader(self.conn.fileno(), self._on_readable)
+                print("✅ Pub/sub LISTEN connection restored")
+                return
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Pub/sub LISTEN failed ({e}); retrying in {PUBSUB_RECONNECT_SECONDS}s")
+                await asyncio.sleep(PUBSUB_RECONNECT_SECONDS)
+
+    def _drop_connection(self):
+        if self.conn is not None:
+            try:
+                self.loop.remove_reader(self.conn.fileno())
+            except Exception:
+                pass
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except Exception as e:
+            # Lost the listening connection: reconnect (notifications sent meanwhile are missed)
+            self.errors += 1
+            print(f"⚠️ Pub/sub connection lost ({e}); reconnecting")
+            self._drop_connection()
+            if not self.stopped:
+                self.reconnect_task = self.loop.create_task(self._reconnect())
+            return
+        while self.conn.notifies:
+            self._deliver(self.conn.notifies.pop(0).payload)
+
+    def _notify(self, payload: str):
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+
+    async def publish(self, payload: str):
+        await run_in_threadpool(self._notify, payload)
+        self.published += 1
+
+    async def stop(self):
+        self.stopped = True
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+        self._drop_connection()
+        await super().stop()
+
+
+class RedisBus(PubSubBus):
+    """Redis PUBLISH/SUBSCRIBE via redis.asyncio (optional dependency)."""
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, channel: str = PUBSUB_CHANNEL):
+        super().__init__(channel)
+        self.url = url
+        self.client = None
+        self.task = None
+
+    async def start(self, handler):
+        import redis.asyncio as redis
+
+        await super().start(handler)
+        self.client = redis.from_url(self.url)
+        self.task = asyncio.create_task(self._reader())
+
+    async def _reader(self):
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        self._deliver(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Redis pub/sub error ({e}); resubscribing in {PUBSUB_RECONNECT_SECONDS}s")
+                await asyncio.sleep(PUBSUB_RECONNECT_SECONDS)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def publish(self, payload: str):
+        await self.client.publish(self.channel, payload)
+        self.published += 1
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.client is not None:
+            await self.client.aclose()
+        await super().stop()
+
+
+def create_bus(backend: str = PUBSUB_BACKEND) -> PubSubBus:
+    if backend == "auto":
+        from .database import engine
+
+        backend = "postgres" if engine.dialect.name == "postgresql" else "memory"
+    if backend == "memory":
+        return InProcessBus()
+    if backend == "unix":
+        return UnixSocketBus()
+    if backend == "postgres":
+        from .database import engine
+
+        return PostgresBus(engine)
+    if backend == "redis":
+        return RedisBus()
+    raise ValueError(f"Unknown PUBSUB_BACKEND {backend!r} (memory, unix, postgres, redis or auto)")
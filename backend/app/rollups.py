@@ -0,0 +1,148 @@
+import os
+from datetime import datetime, timezone
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import SensorLog, SensorRollup
+
+# Rollup resolutions, finest first: name -> bucket width in seconds
+ROLLUP_RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+# Default point budget for /iot/history
+HISTORY_DEFAULT_POINTS = int(os.getenv("HISTORY_DEFAULT_POINTS", 500))
+
+_UPSERT_CHUNK_ROWS = 500
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_BUCKET_KEY = ["user_id", "metric", "resolution", "bucket_start"]
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def bucket_start(ts: datetime, width_seconds: int) -> datetime:
+    epoch = int(_utc(ts).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % width_seconds, tz=timezone.utc)
+
+
+def aggregate(rows, metrics) -> list:
+    """
+    Fold sensor_logs rows (mappings with user_id, timestamp and metric values) into one
+    count/total/min/max entry per (user, metric, resolution, bucket). Missing values are skipped.
+    """
+    groups = {}
+    for row in rows:
+        user_id, ts = row["user_id"], row["timestamp"]
+        if user_id is None or ts is None:
+            continue
+        starts = [(name, bucket_start(ts, width)) for name, width in ROLLUP_RESOLUTIONS.items()]
+        for metric in metrics:
+            value = row[metric]
+            if value is None:
+                continue
+            for resolution, start in starts:
+                key = (user_id, metric, resolution, start)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = {
+                        "user_id": user_id, "metric": metric, "resolution": resolution, "bucket_start": start,
+                        "count": 1, "total": value, "min_value": value, "max_value": value,
+                    }
+                else:
+                    group["count"] += 1
+                    group["total"] += value
+                    group["min_value"] = min(group["min_value"], value)
+                    group["max_value"] = max(group["max_value"], value)
+    # Fixed key order so concurrent upserts lock buckets in the same order (no deadlocks)
+    return [groups[key] for key in sorted(groups)]
+
+
+def upsert_rollups(db, rows, metrics) -> int:
+    """
+    Add freshly inserted sensor_logs rows to their 1m/1h/1d buckets in the caller's transaction
+    (INSERT ... ON CONFLICT DO UPDATE). Returns the number of buckets touched.
+    Only PostgreSQL and SQLite are supported; other databases keep raw rows only.
+    """
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None or not rows:
+        return 0
+
+    buckets = aggregate(rows, metrics)
+    table = SensorRollup.__table__
+    for i in range(0, len(buckets), _UPSERT_CHUNK_ROWS):
+        stmt = dialect_insert(SensorRollup).values(buckets[i:i + _UPSERT_CHUNK_ROWS])
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=_BUCKET_KEY,
+            set_={
+                "count": table.c["count"] + new["count"],
+                "total": table.c["total"] + new["total"],
+                "min_value": case(
+                    (new["min_value"] < table.c["min_value"], new["min_value"]),
+                    else_=func.coalesce(table.c["min_value"], new["min_value"]),
+                ),
+                "max_value": case(
+                    (new["max_value"] > table.c["max_value"], new["max_value"]),
+                    else_=func.coalesce(table.c["max_value"], new["max_value"]),
+                ),
+            },
+        )
+        db.execute(stmt)
+    return len(buckets)
+
+
+def choose_resolution(start: datetime, end: datetime, points: int) -> str:
+    """Finest rollup whose bucket count over [start, end) fits the point budget."""
+    span = (end - start).total_seconds()
+    for name, width in ROLLUP_RESOLUTIONS.items():
+        if span / width <= points:
+            return name
+    return list(ROLLUP_RESOLUTIONS)[-1]
+
+
+def query_history(db, user_id: int, metrics, start: datetime, end: datetime, points: int) -> dict:
+    """
+    Chart series for [start, end) in at most ~`points` points per metric: raw readings when
+    there are few enough, otherwise the finest rollup that fits. Every point has the same
+    shape: {"t": ..., "<metric>": {"mean", "min", "max", "count"}, ...}.
+    """
+    start, end = _utc(start), _utc(end)
+
+    # Raw rows if they fit the budget (bounded read: at most points + 1 rows)
+    raw = db.query(SensorLog.timestamp, *[getattr(SensorLog, m) for m in metrics]).filter(
+        SensorLog.user_id == user_id,
+        SensorLog.timestamp >= start,
+        SensorLog.timestamp < end,
+    ).order_by(SensorLog.timestamp).limit(points + 1).all()
+    if len(raw) <= points:
+        series = []
+        for row in raw:
+            point = {"t": _utc(row.timestamp)}
+            for metric in metrics:
+                value = getattr(row, metric)
+                point[metric] = {"mean": value, "min": value, "max": value, "count": 0 if value is None else 1}
+            series.append(point)
+        return {"resolution": "raw", "start": start, "end": end, "metrics": list(metrics), "points": series}
+
+    resolution = choose_resolution(start, end, points)
+    rows = db.query(SensorRollup).filter(
+        SensorRollup.user_id == user_id,
+        SensorRollup.metric.in_(metrics),
+        SensorRollup.resolution == resolution,
+        SensorRollup.bucket_start >= bucket_start(start, ROLLUP_RESOLUTIONS[resolution]),
+        SensorRollup.bucket_start < end,
+    ).order_by(SensorRollup.bucket_start).all()
+
+    by_bucket = {}
+    for row in rows:
+        t = _utc(row.bucket_start)
+        point = by_bucket.setdefault(t, {"t": t})
+        point[row.metric] = {
+            "mean": row.total / row.count if row.count else None,
+            "min": row.min_value,
+            "max": row.max_value,
+            "count": row.count,
+        }
+    return {
+        "resolution": resolution, "start": start, "end": end, "metrics": list(metrics),
+        "points": [by_bucket[t] for t in sorted(by_bucket)],
+    }
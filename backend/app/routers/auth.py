@@ -10,7 +10,7 @@ from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
 from .. import models, schemas
-from ..database import get_db, engine
+from ..database import get_db, sync_schema
 
 load_dotenv()
 
@@ -21,8 +21,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
 router = APIRouter()
 
-# Create DB tables if they don't exist
-models.Base.metadata.create_all(bind=engine)
+# Create DB tables if they don't exist (plus columns/indexes added to existing tables)
+sync_schema(models.Base.metadata)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -50,6 +50,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def user_from_token(token: str, db: Session) -> Optional[models.User]:
+    """Active user for a bearer token, or None. For callers outside the HTTP dependency chain (websockets)."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None or user.is_deleted == 1:
+        return None
+    return user
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
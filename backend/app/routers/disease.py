@@ -1,16 +1,23 @@
 import os
 import base64
 import json
-import io
+import asyncio
 import numpy as np
-from PIL import Image
-from typing import Dict, Any, Optional
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from typing import Dict, Any, Optional, List
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from ..ml import ml_models
+from ..image_preprocessing import (
+    preprocess_image, preprocess_into, allocate_batch, validate_upload, ImageTooLarge
+)
+from ..model_registry import model_registry, MODEL_WAIT_SECONDS
+from ..prediction_cache import prediction_cache
+from ..vectorstores import get_index_version, DISEASE_INDEX_DIR
+from ..advisory_store import get_advisory, save_advisory
 
 load_dotenv()
 
@@ -18,10 +25,11 @@ router = APIRouter()
 
 MODEL = "gpt-4o-mini"  # Vision + Text model
 
+# Max images accepted by /predict-batch in one request (a scouting visit is typically 20-50)
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", 64))
 
-def encode_image(img_file) -> str:
-    img_file.seek(0)
-    return base64.b64encode(img_file.read()).decode("utf-8")
+# Upper bound for a single LLM call; the request falls back to an error message instead of hanging
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
 
 
 def _get_llm(max_tokens: int = 4000) -> ChatOpenAI:
@@ -34,34 +42,15 @@ def _get_llm(max_tokens: int = 4000) -> ChatOpenAI:
         api_key=api_key,
         max_tokens=max_tokens,
         temperature=0.25,
+        timeout=LLM_TIMEOUT_SECONDS,
     )
 
-# --- CNN & RAG Helper Functions ---
+# Advice strings returned by get_rag_advice_async when it could not produce real advice
+DEGRADED_ADVICE_PREFIXES = ("Detailed advice not available", "No advice generated", "Error generating advice")
 
-def preprocess_image(file_bytes: bytes) -> np.ndarray:
-    """
-    Preprocess image for CNN model (224x224, normalized).
-    """
-    img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-    img = img.resize((224, 224))
-    img_array = np.array(img, dtype=np.float32) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)  # (1, 224, 224, 3)
-    return img_array
-
-def get_rag_advice(disease_name: str, language: str = "en") -> str:
-    """
-    Use RAG to get preventive measures for the predicted disease.
-    """
-    vectorstore = ml_models.get("disease_vectorstore")
-    if not vectorstore:
-        return "Detailed advice not available (RAG system offline)."
+# --- CNN & RAG Helper Functions ---
 
-    try:
-        llm = _get_llm(max_tokens=3000)
-        
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-        
-        prompt_template = """
+RAG_PROMPT_TEMPLATE = """
         You are an expert plant pathologist.
         Use the following context to answer the question.
         
@@ -80,31 +69,72 @@ def get_rag_advice(disease_name: str, language: str = "en") -> str:
         
         If the context doesn't have specific info, use your general knowledge but mention it.
         """
-        
+
+# (id(vectorstore), language) -> RetrievalQA chain, so the LLM client and prompt are built once
+_rag_chains: Dict[tuple, Any] = {}
+
+
+def _get_rag_chain(vectorstore, language: str):
+    key = (id(vectorstore), language)
+    if key not in _rag_chains:
         PROMPT = PromptTemplate(
-            template=prompt_template, 
+            template=RAG_PROMPT_TEMPLATE, 
             input_variables=["context", "question"],
             partial_variables={"language": language}
         )
-        
-        chain = RetrievalQA.from_chain_type(
-            llm=llm,
+        _rag_chains[key] = RetrievalQA.from_chain_type(
+            llm=_get_llm(max_tokens=3000),
             chain_type="stuff",
-            retriever=retriever,
+            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
             chain_type_kwargs={"prompt": PROMPT}
         )
-        
+    return _rag_chains[key]
+
+
+async def get_rag_advice_async(disease_name: str, language: str = "en", refresh: bool = False) -> str:
+    """
+    Use RAG to get preventive measures for the predicted disease.
+    Advice is stored per (disease, language, index version), so repeat diseases skip the LLM;
+    `refresh=True` regenerates and overwrites the stored copy.
+    DB access and retrieval run in the thread pool; the LLM call uses the async client.
+    """
+    vectorstore = model_registry.ensure("disease_vectorstore")
+    if not vectorstore:
+        return "Detailed advice not available (RAG system offline)."
+
+    version = get_index_version(DISEASE_INDEX_DIR)
+    try:
+        cached = None if refresh else await run_in_threadpool(get_advisory, disease_name, language, version)
+        if cached:
+            print(f"📦 Advisory cache hit: {disease_name} ({language})")
+            return cached
+    except Exception as e:
+        print(f"⚠️ Advisory store unavailable: {e}")
+
+    try:
+        chain = _get_rag_chain(vectorstore, language)
         query = f"What are the preventive measures and treatments for {disease_name}?"
-        result = chain.invoke(query)
-        return result.get("result", "No advice generated.")
+        result = await asyncio.wait_for(chain.ainvoke(query), timeout=LLM_TIMEOUT_SECONDS)
+        advice = result.get("result")
+        if not advice:
+            return "No advice generated."
         
+    except asyncio.TimeoutError:
+        print(f"RAG Error: timed out after {LLM_TIMEOUT_SECONDS}s")
+        return "Error generating advice: the advisory service timed out."
     except Exception as e:
         print(f"RAG Error: {e}")
         return f"Error generating advice: {str(e)}"
 
+    try:
+        await run_in_threadpool(save_advisory, disease_name, language, version, advice)
+    except Exception as e:
+        print(f"⚠️ Could not store advisory: {e}")
+    return advice
 
-def ask_about_image(img_file, crop_name: str, query: str):
-    image_b64 = encode_image(img_file)
+
+async def ask_about_image(image_bytes: bytes, crop_name: str, query: str):
+    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
     llm = _get_llm()
 
     enhanced_prompt = (
@@ -188,12 +218,83 @@ def ask_about_image(img_file, crop_name: str, query: str):
         }
     ]
 
-    response = llm.invoke(messages)
+    response = await asyncio.wait_for(llm.ainvoke(messages), timeout=LLM_TIMEOUT_SECONDS)
     return response.content
 
 
+def predict_cnn(contents: bytes, cnn_model, class_indices) -> tuple:
+    """
+    Decode + CNN forward pass (blocking; called from the thread pool).
+    Returns (predicted_class, confidence).
+    """
+    img_array = preprocess_image(contents)
+    preds = cnn_model.predict(img_array, verbose=0)
+    pred_idx = int(np.argmax(preds, axis=1)[0])
+    confidence = float(np.max(preds))
+    return class_indices.get(str(pred_idx), f"Class {pred_idx}"), confidence
+
+
+async def run_until_disconnected(request: Request, coro, poll_seconds: float = 0.5):
+    """
+    Await `coro`, cancelling it (and its LLM call) if the client goes away first.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print("🔌 Client disconnected, cancelling disease analysis")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def analyze_image(contents: bytes, crop_name: str, query: str, language: str) -> Dict[str, Any]:
+    # Check if CNN model is loaded (waits briefly if it is still loading in the background)
+    cnn_model = await model_registry.ensure_async("disease_cnn", MODEL_WAIT_SECONDS)
+    class_indices = await model_registry.ensure_async("class_indices", MODEL_WAIT_SECONDS)
+    
+    if cnn_model and class_indices:
+        print("🧠 Using CNN + RAG Pipeline")
+        await model_registry.ensure_async("disease_vectorstore", MODEL_WAIT_SECONDS)
+        
+        # 1. CNN Prediction (image decode + inference off the event loop)
+        try:
+            predicted_class, confidence = await run_in_threadpool(predict_cnn, contents, cnn_model, class_indices)
+            print(f"✅ CNN Prediction: {predicted_class} ({confidence:.2f})")
+            
+            # 2. RAG Advice
+            advice = await get_rag_advice_async(predicted_class, language)
+            
+            return {
+                "predicted_class": predicted_class,
+                "confidence": confidence,
+                "preventive_measures": advice,
+                "method": "CNN+RAG"
+            }
+        except Exception as cnn_error:
+            # If CNN fails, fall through to GPT-4
+            print(f"❌ CNN Error: {cnn_error}. Falling back to GPT-4.")
+    
+    print("🤖 Using GPT-4 Vision Fallback")
+    # Fallback to GPT-4 Vision
+    result = await ask_about_image(contents, crop_name, query)
+    
+    return {
+        "predicted_class": "AI Analysis (GPT-4 Vision)",
+        "confidence": 1.0,
+        "preventive_measures": result,
+        "method": "GPT-4-Vision"
+    }
+
+
 @router.post("/predict")
 async def predict_disease(
+    request: Request,
     file: UploadFile = File(...),
     crop_name: str = Form("Unknown Crop"),
     query: str = Form("Identify the disease and provide detailed treatment recommendations."),
@@ -202,53 +303,131 @@ async def predict_disease(
     """
     Upload a plant leaf image to detect disease.
     Uses CNN + RAG if available, otherwise falls back to GPT-4 Vision.
+    Nothing here blocks the event loop, and the analysis is cancelled if the client disconnects.
+    Re-uploads of the same photo are answered from cache with "cached": true; "cache_match" says
+    whether it was the identical file ("exact") or the same picture re-encoded ("near_duplicate").
     """
     try:
-        # Check if CNN model is loaded
-        cnn_model = ml_models.get("disease_cnn")
-        class_indices = ml_models.get("class_indices")
-        
-        if cnn_model and class_indices:
-            print("🧠 Using CNN + RAG Pipeline")
-            # Read file content
-            contents = await file.read()
-            
-            # 1. CNN Prediction
-            try:
-                img_array = preprocess_image(contents)
-                preds = cnn_model.predict(img_array)
-                pred_idx = int(np.argmax(preds, axis=1)[0])
-                confidence = float(np.max(preds))
-                
-                predicted_class = class_indices.get(str(pred_idx), f"Class {pred_idx}")
-                print(f"✅ CNN Prediction: {predicted_class} ({confidence:.2f})")
-                
-                # 2. RAG Advice
-                advice = get_rag_advice(predicted_class, language)
-                
-                return {
-                    "predicted_class": predicted_class,
-                    "confidence": confidence,
-                    "preventive_measures": advice,
-                    "method": "CNN+RAG"
-                }
-            except Exception as cnn_error:
-                print(f"❌ CNN Error: {cnn_error}. Falling back to GPT-4.")
-                # If CNN fails, fall through to GPT-4
-                await file.seek(0) # Reset file pointer
-        
-        print("🤖 Using GPT-4 Vision Fallback")
-        # Fallback to GPT-4 Vision
-        # Ensure file pointer is at start
-        await file.seek(0)
-        result = ask_about_image(file.file, crop_name, query)
-        
-        return {
-            "predicted_class": "AI Analysis (GPT-4 Vision)",
-            "confidence": 1.0,
-            "preventive_measures": result,
-            "method": "GPT-4-Vision"
-        }
+        contents = await file.read()
+        validate_upload(contents)
+        key, phash, cached, match = await run_in_threadpool(
+            prediction_cache.lookup, contents, crop_name, language, query
+        )
+        if cached is not None:
+            print(f"📦 Prediction cache hit ({match}): {cached['predicted_class']}")
+            return {**cached, "cached": True, "cache_match": match}
+
+        result = await run_until_disconnected(request, analyze_image(contents, crop_name, query, language))
+        if is_cacheable(result):
+            prediction_cache.put(key, phash, result)
+        return {**result, "cached": False, "cache_match": None}
+    except HTTPException:
+        raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except asyncio.TimeoutError:
+        print("❌ Prediction Error: LLM timed out")
+        raise HTTPException(status_code=504, detail="Analysis timed out")
     except Exception as e:
         print(f"❌ Prediction Error: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+def is_cacheable(result: Dict[str, Any]) -> bool:
+    """Don't pin degraded answers (RAG offline, LLM timeout, ...) in the prediction cache."""
+    return not str(result.get("preventive_measures", "")).startswith(DEGRADED_ADVICE_PREFIXES)
+
+
+def summarize_predictions(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Field-level aggregate: class distribution and confidence over the successfully analyzed images."""
+    analyzed = [r for r in results if not r.get("error")]
+    distribution: Dict[str, int] = {}
+    confidence_sums: Dict[str, float] = {}
+    for r in analyzed:
+        distribution[r["predicted_class"]] = distribution.get(r["predicted_class"], 0) + 1
+        confidence_sums[r["predicted_class"]] = confidence_sums.get(r["predicted_class"], 0.0) + r["confidence"]
+
+    return {
+        "images": len(results),
+        "analyzed": len(analyzed),
+        "failed": len(results) - len(analyzed),
+        "class_distribution": dict(sorted(distribution.items(), key=lambda kv: -kv[1])),
+        "class_share": {name: round(count / len(analyzed), 4) for name, count in distribution.items()} if analyzed else {},
+        "mean_confidence": round(sum(r["confidence"] for r in analyzed) / len(analyzed), 4) if analyzed else None,
+        "mean_confidence_by_class": {
+            name: round(confidence_sums[name] / count, 4) for name, count in distribution.items()
+        },
+        "dominant_class": max(distribution, key=distribution.get) if distribution else None,
+    }
+
+
+@router.post("/predict-batch")
+async def predict_disease_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    crop_name: str = Form("Unknown Crop"),
+    language: str = Form("en")
+):
+    """
+    Diagnose all leaf photos from one field visit at once.
+    Images are decoded in parallel, classified in a single CNN forward pass, and advisory
+    text is generated once per predicted class. Returns per-image results plus a field aggregate.
+    """
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Too many images (max {MAX_BATCH_IMAGES})")
+
+    cnn_model = await model_registry.ensure_async("disease_cnn", MODEL_WAIT_SECONDS)
+    class_indices = await model_registry.ensure_async("class_indices", MODEL_WAIT_SECONDS)
+    if not cnn_model or not class_indices:
+        raise HTTPException(status_code=503, detail="Disease CNN not loaded; use /disease/predict for single images")
+    await model_registry.ensure_async("disease_vectorstore", MODEL_WAIT_SECONDS)
+
+    async def analyze_batch() -> Dict[str, Any]:
+        contents = [await f.read() for f in files]
+        results: List[Dict[str, Any]] = [{"filename": f.filename} for f in files]
+
+        # 1. Decode + resize in parallel worker threads straight into one NHWC buffer
+        #    (PIL releases the GIL while decoding)
+        buffer = allocate_batch(len(contents))
+        outcomes = await asyncio.gather(
+            *(run_in_threadpool(preprocess_into, buffer, i, c) for i, c in enumerate(contents)),
+            return_exceptions=True,
+        )
+        valid = []
+        for i, outcome in enumerate(outcomes):
+            if isinstance(outcome, ImageTooLarge):
+                results[i]["error"] = str(outcome)
+            elif isinstance(outcome, Exception):
+                results[i]["error"] = f"Could not read image ({type(outcome).__name__})"
+            else:
+                valid.append(i)
+
+        # 2. One batched CNN forward pass for every decodable image
+        if valid:
+            batch = buffer if len(valid) == len(contents) else buffer[valid]
+            preds = await run_in_threadpool(cnn_model.predict, batch, verbose=0)
+            for row, i in enumerate(valid):
+                pred_idx = int(np.argmax(preds[row]))
+                results[i]["predicted_class"] = class_indices.get(str(pred_idx), f"Class {pred_idx}")
+                results[i]["confidence"] = float(preds[row][pred_idx])
+
+        # 3. Advisory once per distinct predicted class
+        classes = sorted({r["predicted_class"] for r in results if "predicted_class" in r})
+        advice = await asyncio.gather(*(get_rag_advice_async(name, language) for name in classes))
+        print(f"✅ Batch CNN: {len(valid)}/{len(files)} images, {len(classes)} distinct classes")
+
+        return {
+            "crop_name": crop_name,
+            "method": "CNN+RAG",
+            "results": results,
+            "aggregate": summarize_predictions(results),
+            "advisories": dict(zip(classes, advice)),
+        }
+
+    try:
+        return await run_until_disconnected(request, analyze_batch())
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Batch Prediction Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
@@ -1,112 +1,239 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+import os
 import json
+import base64
 
 from .. import schemas, models
 from ..database import get_db
-from ..manager import manager
+from ..alerts import deliver_alerts
+from ..ingest import sensor_buffer, write_sensor_rows, SENSOR_FIELDS
+from ..device_routing import device_routes
+from ..rollups import query_history, HISTORY_DEFAULT_POINTS
+from ..latest_state import latest_reading
 from .auth import get_current_user
 
 router = APIRouter()
 
+# Readings accepted per /iot/bulk request
+MAX_SENSOR_BATCH = int(os.getenv("MAX_SENSOR_BATCH", 5000))
+
+
+def encode_log_cursor(log: models.SensorLog) -> str:
+    raw = json.dumps({"t": log.timestamp.isoformat(), "i": log.id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_log_cursor(cursor: str) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(raw["t"]), int(raw["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 @router.get("/my-logs", response_model=List[schemas.SensorLogOut])
 def get_my_logs(
+    response: Response,
+    cursor: Optional[str] = None,
     skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(100, ge=1, le=1000), 
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get sensor logs for the currently logged-in user."""
-    logs = db.query(models.SensorLog)\
-             .filter(models.SensorLog.user_id == current_user.id)\
-             .order_by(models.SensorLog.timestamp.desc())\
-             .offset(skip)\
-             .limit(limit)\
-             .all()
+    """
+    Get sensor logs for the currently logged-in user, newest first.
+    Pass the `X-Next-Cursor` response header back as `cursor` for the next page (keyset
+    pagination: every page costs the same, however deep). `skip` is still accepted for
+    old clients but gets slower the deeper it goes.
+    """
+    query = db.query(models.SensorLog)\
+              .filter(models.SensorLog.user_id == current_user.id)\
+              .order_by(models.SensorLog.timestamp.desc(), models.SensorLog.id.desc())
+    if cursor:
+        ts, log_id = decode_log_cursor(cursor)
+        query = query.filter(tuple_(models.SensorLog.timestamp, models.SensorLog.id) < tuple_(ts, log_id))
+    elif skip:
+        query = query.offset(skip)
+    logs = query.limit(limit).all()
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_log_cursor(logs[-1])
     return logs
 
 
+@router.get("/history", response_model=schemas.SensorHistoryOut)
+def get_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    metrics: str = "moisture",
+    points: int = Query(HISTORY_DEFAULT_POINTS, ge=1, le=5000),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Chart-ready sensor history for the logged-in user (default: the last 7 days).
+    Returns raw readings when at most `points` fall in the range, otherwise 1-minute,
+    1-hour or 1-day min/max/mean rollups, whichever is finest within the point budget.
+    `metrics` is a comma-separated subset of moisture, nitrogen, phosphorus, potassium,
+    temperature, humidity.
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    names = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in names if m not in SENSOR_FIELDS]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics {unknown}; choose from {list(SENSOR_FIELDS)}")
+    return query_history(db, current_user.id, names, start, end, points)
+
+
 @router.get("/latest", response_model=schemas.SensorLogOut)
 def get_latest_log(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get the most recent sensor reading for the logged-in user."""
-    log = db.query(models.SensorLog)\
-            .filter(models.SensorLog.user_id == current_user.id)\
-            .order_by(models.SensorLog.timestamp.desc())\
-            .first()
-    if not log:
-        raise HTTPException(status_code=404, detail="No sensor data found")
-    return log
-
-
-@router.post("/update", response_model=schemas.SensorLogOut)
-async def update_sensor(data: schemas.SensorData, db: Session = Depends(get_db)):
-    """Accept incoming IoT sensor payloads."""
-    # Find ALL users by device_id
-    users = db.query(models.User).filter(models.User.device_id == data.device_id).all()
-    if not users:
-        raise HTTPException(status_code=404, detail="Device ID not registered to any user")
+    """Get the most recent sensor reading for the logged-in user (one primary-key lookup)."""
+    state = latest_reading(db, current_user.id)
+    if not state:
+        # Readings stored before latest_sensor_state existed (until backfill_rollups.py is run)
+        latest_log = db.query(models.SensorLog).filter(
+            models.SensorLog.user_id == current_user.id
+        ).order_by(models.SensorLog.timestamp.desc(), models.SensorLog.id.desc()).first()
+        if not latest_log:
+            raise HTTPException(status_code=404, detail="No sensor data found")
+        return latest_log
+    return schemas.SensorLogOut(
+        id=state.sensor_log_id,
+        user_id=state.user_id,
+        timestamp=state.timestamp,
+        **{field: getattr(state, field) for field in SENSOR_FIELDS},
+    )
+
 
-    # Create a log for the first user to return as response (and save for all)
-    first_log = None
-
-    for user in users:
-        sensor_log = models.SensorLog(
-            user_id=user.id,
-            moisture=data.moisture,
-            nitrogen=data.nitrogen,
-            phosphorus=data.phosphorus,
-            potassium=data.potassium,
-            temperature=data.temperature,
-            humidity=data.humidity
-        )
-        db.add(sensor_log)
-        
-        if first_log is None:
-            first_log = sensor_log
-
-    db.commit()
-    if first_log:
-        db.refresh(first_log)
-
-    # Real-time Alert Logic
-    alerts = []
-    if data.moisture is not None and data.moisture < 30:
-        alerts.append(f"CRITICAL: Low soil moisture ({data.moisture}%)")
-    
-    if data.temperature is not None and data.temperature > 40:
-        alerts.append(f"WARNING: High temperature ({data.temperature}°C)")
-
-    if alerts:
-        # Broadcast to ALL users associated with this device
-        for user in users:
-            message_payload = {
-                "user_id": user.id,
-                "messages": alerts,
-                "timestamp": str(first_log.timestamp) if first_log else ""
-            }
-            await manager.broadcast(json.dumps(message_payload))
-
-    return first_log
+async def resolve_device(device_id: str) -> tuple:
+    """Active user ids bound to the device (routing cache first); 404 if none."""
+    user_ids = device_routes.cached(device_id)
+    if user_ids is None:
+        user_ids = await run_in_threadpool(device_routes.resolve, device_id)
+    if not user_ids:
+        raise HTTPException(status_code=404, detail="Device ID not registered to any user")
+    return user_ids
+
+
+@router.post("/update", response_model=schemas.SensorAck)
+async def update_sensor(data: schemas.SensorData):
+    """
+    Accept incoming IoT sensor payloads.
+    The reading is queued for a batched insert (app/ingest.py) and acknowledged right away;
+    alerts are evaluated when the batch is written (app/alerts.py: only on state changes).
+    """
+    # Find ALL (active) users bound to this device_id; served from the routing cache
+    user_ids = await resolve_device(data.device_id)
+
+    # Stamp on arrival so the write-behind delay doesn't shift the recorded time
+    received_at = datetime.now(timezone.utc)
+    reading = {field: getattr(data, field) for field in SENSOR_FIELDS}
+    rows = [
+        {"user_id": user_id, "device_id": data.device_id, "timestamp": received_at, **reading}
+        for user_id in user_ids
+    ]
+    if not sensor_buffer.add(rows):
+        raise HTTPException(status_code=503, detail="Sensor ingest is backed up, retry shortly")
+
+    return {"status": "accepted", "device_id": data.device_id, "users": len(user_ids), "timestamp": received_at}
+
+
+def decode_sensor_batch(body: bytes, content_type: str):
+    """JSON by default; MessagePack / CBOR when the optional `msgpack` / `cbor2` packages are installed."""
+    if content_type in ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack"):
+        import msgpack
+        return msgpack.unpackb(body, raw=False, timestamp=3)
+    if content_type == "application/cbor":
+        import cbor2
+        return cbor2.loads(body)
+    return json.loads(body)
+
+
+@router.post("/bulk", response_model=schemas.SensorBatchAck)
+async def bulk_upload(request: Request):
+    """
+    Upload readings a device buffered while offline, with device-side timestamps.
+    Body is a SensorBatch as JSON (object or compact columnar form), MessagePack
+    (`application/msgpack`) or CBOR (`application/cbor`). The batch is stored in one
+    transaction; re-sent readings (same device_id + ts) are skipped, so retries are safe.
+    Alerts are evaluated on the newest reading only, and only if it is newer than what is stored.
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    try:
+        payload = decode_sensor_batch(await request.body(), content_type)
+    except ImportError:
+        raise HTTPException(status_code=415, detail=f"{content_type} is not supported on this server")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode {content_type} body: {e}")
+
+    try:
+        batch = schemas.SensorBatch.model_validate(payload)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    if len(batch.readings) > MAX_SENSOR_BATCH:
+        raise HTTPException(status_code=413, detail=f"Too many readings (max {MAX_SENSOR_BATCH} per batch)")
+    if not batch.readings:
+        return {"device_id": batch.device_id, "received": 0, "rows_inserted": 0, "rows_skipped": 0}
+
+    user_ids = await resolve_device(batch.device_id)
+    stamped = [
+        (r.ts.astimezone(timezone.utc) if r.ts.tzinfo else r.ts.replace(tzinfo=timezone.utc), r)
+        for r in batch.readings
+    ]
+    rows = [
+        {"user_id": user_id, "device_id": batch.device_id, "timestamp": ts,
+         **{field: getattr(r, field) for field in SENSOR_FIELDS}}
+        for ts, r in stamped
+        for user_id in user_ids
+    ]
+    alerts = {}
+    inserted = await run_in_threadpool(write_sensor_rows, rows, alerts)
+    await deliver_alerts(alerts)
+    return {
+        "device_id": batch.device_id,
+        "received": len(batch.readings),
+        "rows_inserted": inserted,
+        "rows_skipped": len(rows) - inserted,
+    }
 
 
 @router.post("/sensor", response_model=schemas.SensorLogOut)
-def receive_sensor(data: schemas.SensorData, db: Session = Depends(get_db)):
-    """Legacy endpoint - redirects to update logic (kept for backward compatibility if needed)."""
-    sensor_log = models.SensorLog(
-        user_id=data.user_id,
-        moisture=data.moisture,
-        nitrogen=data.nitrogen,
-        phosphorus=data.phosphorus,
-        potassium=data.potassium,
-        temperature=data.temperature,
-        humidity=data.humidity
+async def receive_sensor(data: schemas.SensorData, db: Session = Depends(get_db)):
+    """
+    Legacy endpoint (kept for backward compatibility; new devices use /update).
+    The reading is stored right away through the same path as /bulk (rollups, latest state,
+    re-send dedup, alerts) and the stored row of the first user bound to the device is returned.
+    """
+    user_ids = await resolve_device(data.device_id)
+    received_at = datetime.now(timezone.utc)
+    reading = {field: getattr(data, field) for field in SENSOR_FIELDS}
+    rows = [
+        {"user_id": user_id, "device_id": data.device_id, "timestamp": received_at, **reading}
+        for user_id in user_ids
+    ]
+    alerts = {}
+    await run_in_threadpool(write_sensor_rows, rows, alerts)
+    await deliver_alerts(alerts)
+
+    sensor_log = await run_in_threadpool(
+        lambda: db.query(models.SensorLog).filter(
+            models.SensorLog.device_id == data.device_id,
+            models.SensorLog.user_id == user_ids[0],
+            models.SensorLog.timestamp == received_at,
+        ).first()
     )
-    db.add(sensor_log)
-    db.commit()
-    db.refresh(sensor_log)
+    if not sensor_log:
+        raise HTTPException(status_code=500, detail="Sensor reading was not stored")
     return sensor_log
@@ -7,28 +7,21 @@ import re
 import time
 import random
 import numpy as np
+import json
 from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
 from .. import schemas, models
 from ..database import get_db
 from .auth import get_current_user
-from ..ml import ml_models
-
-from ..krishi_saathi_llm import KrishiSaathiAdvisor
+from ..ml import ml_models, predict_fertilizer_rows, fertilizer_batcher
+from ..model_registry import model_registry, MODEL_WAIT_SECONDS
 
 router = APIRouter()
 
-# Initialize Advisor
-try:
-    advisor = KrishiSaathiAdvisor()
-    print("✅ Krishi Saathi Advisor initialized!")
-except Exception as e:
-    print(f"❌ Error initializing Advisor: {e}")
-    advisor = None
-
 # --- NDVI Integration (AgroMonitoring) ---
 AGRO_API_KEY = os.getenv("AGRO_API_KEY", "5e2ed96e32afbcac715fccb11814026b")
 
@@ -367,44 +360,6 @@ CROP_BENCHMARK_YIELD = {
     "niger": 0.7,
 }
 
-CROP_ALERT_RULES = {
-    "sunflower": {"max_temp_flowering": 34, "min_rain_flowering": 30, "max_humidity": 80},
-    "soybean": {"max_temp_flowering": 32, "min_rain_flowering": 35, "max_humidity": 85},
-    "mustard": {"max_temp_flowering": 30, "min_rain_flowering": 25, "max_humidity": 88},
-    "groundnut": {"max_temp_flowering": 35, "min_rain_flowering": 40, "max_humidity": 82},
-    "sesame": {"max_temp_flowering": 33, "min_rain_flowering": 25, "max_humidity": 80},
-    "castor": {"max_temp_flowering": 34, "min_rain_flowering": 28, "max_humidity": 84},
-    "safflower": {"max_temp_flowering": 32, "min_rain_flowering": 22, "max_humidity": 80},
-    "niger": {"max_temp_flowering": 30, "min_rain_flowering": 20, "max_humidity": 78},
-}
-
-def generate_weather_alerts(crop, temp_flowering, rain_flowering, humidity):
-    crop = crop.lower()
-    rules = CROP_ALERT_RULES.get(crop, CROP_ALERT_RULES["soybean"])
-    alerts = []
-
-    if temp_flowering >= rules["max_temp_flowering"] + 3:
-        alerts.append("🔥 Severe heat at flowering → high risk of flower drop.")
-    elif temp_flowering >= rules["max_temp_flowering"]:
-        alerts.append("🌡️ High temperature at flowering → moderate heat stress risk.")
-
-    if rain_flowering <= 0.5 * rules["min_rain_flowering"]:
-        alerts.append("💧 Very low rainfall during flowering → severe moisture stress.")
-    elif rain_flowering <= rules["min_rain_flowering"]:
-        alerts.append("💧 Low rainfall during flowering → moisture stress risk.")
-
-    if humidity >= rules["max_humidity"] + 5:
-        alerts.append("🦠 Very high humidity → strong risk of fungal diseases.")
-    elif humidity >= rules["max_humidity"]:
-        alerts.append("🦠 High humidity → increased probability of foliar diseases.")
-
-    if temp_flowering >= rules["max_temp_flowering"] and rain_flowering <= rules["min_rain_flowering"]:
-        alerts.append("⚠️ Combination of high temperature and low rainfall at flowering.")
-
-    if not alerts:
-        alerts.append("✅ No major weather red-flags detected.")
-
-    return alerts
 
 @router.get("/get-yield-prediction", response_model=schemas.KrishiYieldOut)
 def get_yield_prediction_get(
@@ -457,48 +412,22 @@ def predict_yield(data: schemas.KrishiYieldInput):
     }
 
 @router.post("/recommend", response_model=schemas.FertilizerRecommendationOutput)
-def recommend_fertilizer(data: schemas.FertilizerRecommendationInput):
-    model = ml_models.get("fertilizer_model")
-    preprocessor = ml_models.get("preprocessor")
-
-    if not model:
+async def recommend_fertilizer(data: schemas.FertilizerRecommendationInput):
+    await model_registry.ensure_async("fertilizer_model", MODEL_WAIT_SECONDS)
+    if not ml_models.get("fertilizer_model"):
         raise HTTPException(status_code=500, detail="Fertilizer Model not loaded")
-    if not preprocessor:
+    if not ml_models.get("preprocessor"):
         raise HTTPException(status_code=500, detail="Preprocessor not loaded")
 
-    # Prepare DataFrame matching training columns:
-    # ['crop', 'yield_t_ha', 'soil_N_status_kg_ha', 'soil_P_status_kg_ha', 'soil_K_status_kg_ha', 'mean_temp_gs_C', 'soil_pH', 'soil_moisture_pct']
-    
-    input_data = {
-        "crop": [data.crop],
-        "yield_t_ha": [data.target_yield],
-        "soil_N_status_kg_ha": [data.soil_N],
-        "soil_P_status_kg_ha": [data.soil_P],
-        "soil_K_status_kg_ha": [data.soil_K],
-        "mean_temp_gs_C": [data.temperature],
-        "soil_pH": [data.ph],
-        "soil_moisture_pct": [data.moisture]
-    }
-    
-    df = pd.DataFrame(input_data)
-    
     try:
-        # 1. Preprocess
-        X_transformed = preprocessor.transform(df)
-        
-        # 2. Predict (Returns [[N, P, K]])
-        prediction = model.predict(X_transformed)
-        n_val, p_val, k_val = prediction[0]
-        
-        # Ensure non-negative
-        n_val = max(0.0, float(n_val))
-        p_val = max(0.0, float(p_val))
-        k_val = max(0.0, float(k_val))
+        # Concurrent requests are merged into one preprocess + predict call by the shared batcher.
+        # Returns [N, P, K], already clipped to be non-negative.
+        n_val, p_val, k_val = await fertilizer_batcher.submit(data)
         
         return {
-            "recommended_N": round(n_val, 2),
-            "recommended_P": round(p_val, 2),
-            "recommended_K": round(k_val, 2),
+            "recommended_N": round(float(n_val), 2),
+            "recommended_P": round(float(p_val), 2),
+            "recommended_K": round(float(k_val), 2),
             "unit": "kg/ha"
         }
         
@@ -507,8 +436,87 @@ def recommend_fertilizer(data: schemas.FertilizerRecommendationInput):
         raise HTTPException(status_code=400, detail=f"Recommendation error: {str(e)}")
 
 
+# --- Batch Fertilizer Recommendation ---
+MAX_FERTILIZER_BATCH = int(os.getenv("MAX_FERTILIZER_BATCH", 10000))
+FERTILIZER_STREAM_CHUNK = 1000
+
+
+def _score_fertilizer_rows(indexed_rows: list) -> list:
+    """
+    Score [(index, FertilizerRecommendationInput), ...] with a single preprocess + predict call.
+    """
+    predictions = predict_fertilizer_rows([row for _, row in indexed_rows])
+    results = []
+    for (index, _), prediction in zip(indexed_rows, predictions):
+        if isinstance(prediction, Exception):
+            results.append({"index": index, "error": f"Recommendation error: {str(prediction)}"})
+            continue
+        n_val, p_val, k_val = prediction
+        results.append({
+            "index": index,
+            "recommended_N": round(float(n_val), 2),
+            "recommended_P": round(float(p_val), 2),
+            "recommended_K": round(float(k_val), 2),
+            "unit": "kg/ha",
+        })
+    return results
+
+
+def _iter_fertilizer_batch(items: list, chunk_size: int):
+    """
+    Validate and score `items` chunk by chunk, yielding one result dict per row in input order.
+    """
+    for start in range(0, len(items), chunk_size):
+        results = {}
+        valid = []
+        for index, raw in enumerate(items[start:start + chunk_size], start=start):
+            try:
+                row = schemas.FertilizerRecommendationInput(**raw)
+            except ValidationError as e:
+                first = e.errors()[0]
+                field = ".".join(str(part) for part in first.get("loc", ()))
+                results[index] = {"index": index, "error": f"Invalid input: {field}: {first.get('msg')}"}
+                continue
+            values = [row.target_yield, row.soil_N, row.soil_P, row.soil_K, row.temperature, row.ph, row.moisture]
+            if not np.all(np.isfinite(values)):
+                results[index] = {"index": index, "error": "Invalid input: non-finite numeric value"}
+                continue
+            valid.append((index, row))
+
+        for item in _score_fertilizer_rows(valid):
+            results[item["index"]] = item
+
+        for index in sorted(results):
+            yield results[index]
+
+
+@router.post("/recommend/batch", response_model=schemas.FertilizerBatchOutput)
+def recommend_fertilizer_batch(data: schemas.FertilizerBatchInput, stream: bool = False):
+    """
+    Score many fields at once. Rows that fail validation or prediction carry an `error`
+    instead of failing the whole batch. With `stream=true` results are sent as NDJSON,
+    one line per row, as each chunk is scored.
+    """
+    model_registry.ensure("fertilizer_model", MODEL_WAIT_SECONDS)
+    if not ml_models.get("fertilizer_model"):
+        raise HTTPException(status_code=500, detail="Fertilizer Model not loaded")
+    if not ml_models.get("preprocessor"):
+        raise HTTPException(status_code=500, detail="Preprocessor not loaded")
+    if len(data.items) > MAX_FERTILIZER_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_FERTILIZER_BATCH} rows)")
+
+    if stream:
+        lines = (json.dumps(item) + "\n" for item in _iter_fertilizer_batch(data.items, FERTILIZER_STREAM_CHUNK))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    results = list(_iter_fertilizer_batch(data.items, max(len(data.items), 1)))
+    failed = sum(1 for item in results if item.get("error"))
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed}
+
+
 @router.post("/chat", response_model=schemas.KrishiChatOut)
 def chat_advisor(data: schemas.KrishiChatInput):
+    advisor = model_registry.ensure("krishi_advisor", MODEL_WAIT_SECONDS)
     if not advisor:
         raise HTTPException(status_code=500, detail="Advisor not initialized")
     
@@ -0,0 +1,271 @@
+import string
+import numpy as np
+import pandas as pd
+
+# The one registry of alert thresholds. Rules are declared as data and compiled into NumPy
+# predicates, so a rule set is evaluated over a whole batch of readings (column arrays) at once.
+#
+# A rule:  {"name", "when": [conditions], "message", optional "group", "clear", "value"}
+#   condition   (field, op, threshold); op is one of <, <=, >, >=, ==, !=. The threshold is a
+#               constant or param(name, scale, offset), looked up per row in the crop's params.
+#   group       rules sharing a group are exclusive: the first matching one (in order) wins,
+#               like an if/elif chain.
+#   clear       conditions under which a raised alert clears (hysteresis); a rule is also
+#               cleared when another rule of its group is raised.
+#   value       field reported with the alert (defaults to the first condition's field).
+#   message     str.format template over the row's fields.
+# A rule set's "fallback" message is given to rows where no rule fired.
+
+# Per-crop thresholds for the flowering-stage rules; unknown crops use DEFAULT_CROP's
+CROP_ALERT_RULES = {
+    "sunflower": {"max_temp_flowering": 34, "min_rain_flowering": 30, "max_humidity": 80},
+    "soybean": {"max_temp_flowering": 32, "min_rain_flowering": 35, "max_humidity": 85},
+    "mustard": {"max_temp_flowering": 30, "min_rain_flowering": 25, "max_humidity": 88},
+    "groundnut": {"max_temp_flowering": 35, "min_rain_flowering": 40, "max_humidity": 82},
+    "sesame": {"max_temp_flowering": 33, "min_rain_flowering": 25, "max_humidity": 80},
+    "castor": {"max_temp_flowering": 34, "min_rain_flowering": 28, "max_humidity": 84},
+    "safflower": {"max_temp_flowering": 32, "min_rain_flowering": 22, "max_humidity": 80},
+    "niger": {"max_temp_flowering": 30, "min_rain_flowering": 20, "max_humidity": 78},
+}
+DEFAULT_CROP = "soybean"
+
+
+def param(name: str, scale: float = 1.0, offset: float = 0.0) -> dict:
+    """Threshold taken from the row's crop params: params[name] * scale + offset."""
+    return {"param": name, "scale": scale, "offset": offset}
+
+
+RULE_SETS = {
+    # Field sensors (ingest and the alert scheduler, through app/alerts.py)
+    "sensor": {
+        "rules": [
+            {
+                "name": "moisture_low", "when": [("moisture", "<", 30)], "clear": [("moisture", ">=", 35)],
+                "message": "💧 CRITICAL MOISTURE: Soil moisture is low ({moisture}%). Turn on pump.",
+            },
+            {
+                "name": "moisture_high", "when": [("moisture", ">", 90)], "clear": [("moisture", "<=", 85)],
+                "message": "💧 HIGH MOISTURE: Soil is saturated ({moisture}%). Stop irrigation.",
+            },
+            {
+                "name": "temperature_high", "when": [("temperature", ">", 40)], "clear": [("temperature", "<=", 38)],
+                "message": "🌡️ HIGH TEMPERATURE: {temperature}°C at the field sensor.",
+            },
+        ],
+    },
+    # Forecast for the user's area (alert scheduler)
+    "weather": {
+        "rules": [
+            {
+                "name": "weather_storm", "group": "forecast", "value": "rain_prob",
+                "when": [("condition", "==", "Storm")], "clear": [("condition", "!=", "Storm")],
+                "message": "⚠️ STORM ALERT for {city}: Heavy rain expected. Delay irrigation.",
+            },
+            {
+                "name": "weather_heatwave", "group": "forecast", "value": "rain_prob",
+                "when": [("condition", "==", "Heatwave")], "clear": [("condition", "!=", "Heatwave")],
+                "message": "🔥 HEATWAVE ALERT for {city}: High temps. Ensure sufficient irrigation.",
+            },
+            {
+                "name": "weather_rain", "group": "forecast",
+                "when": [("rain_prob", ">", 80)], "clear": [("rain_prob", "<", 70)],
+                "message": "🌧️ RAIN FORECAST for {city}: 80% chance of rain. Skip irrigation today.",
+            },
+        ],
+    },
+    # Flowering-stage weather per crop (yield advisory)
+    "crop_flowering": {
+        "crop_params": CROP_ALERT_RULES,
+        "fallback": "✅ No major weather red-flags detected.",
+        "rules": [
+            {
+                "name": "severe_heat", "group": "heat",
+                "when": [("temp_flowering", ">=", param("max_temp_flowering", offset=3))],
+                "message": "🔥 Severe heat at flowering → high risk of flower drop.",
+            },
+            {
+                "name": "heat_stress", "group": "heat",
+                "when": [("temp_flowering", ">=", param("max_temp_flowering"))],
+                "message": "🌡️ High temperature at flowering → moderate heat stress risk.",
+            },
+            {
+                "name": "severe_drought", "group": "rain",
+                "when": [("rain_flowering", "<=", param("min_rain_flowering", scale=0.5))],
+                "message": "💧 Very low rainfall during flowering → severe moisture stress.",
+            },
+            {
+                "name": "drought", "group": "rain",
+                "when": [("rain_flowering", "<=", param("min_rain_flowering"))],
+                "message": "💧 Low rainfall during flowering → moisture stress risk.",
+            },
+            {
+                "name": "severe_fungal_risk", "group": "humidity",
+                "when": [("humidity", ">=", param("max_humidity", offset=5))],
+                "message": "🦠 Very high humidity → strong risk of fungal diseases.",
+            },
+            {
+                "name": "fungal_risk", "group": "humidity",
+                "when": [("humidity", ">=", param("max_humidity"))],
+                "message": "🦠 High humidity → increased probability of foliar diseases.",
+            },
+            {
+                "name": "heat_and_drought",
+                "when": [
+                    ("temp_flowering", ">=", param("max_temp_flowering")),
+                    ("rain_flowering", "<=", param("min_rain_flowering")),
+                ],
+                "message": "⚠️ Combination of high temperature and low rainfall at flowering.",
+            },
+        ],
+    },
+}
+
+_OPS = {
+    "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+    "==": np.equal, "!=": np.not_equal,
+}
+
+
+class RuleSet:
+    """A rule set from RULE_SETS compiled to predicates over a batch {field: array}."""
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.crop_params = spec.get("crop_params")
+        self.fallback = spec.get("fallback")
+        self.rules = []
+        for rule in spec["rules"]:
+            self.rules.append({
+                "name": rule["name"],
+                "group": rule.get("group"),
+                "when": [self._compile(condition) for condition in rule["when"]],
+                "clear": [self._compile(condition) for condition in rule.get("clear", ())],
+                "value": rule.get("value", rule["when"][0][0]),
+                "message": rule["message"],
+                "message_fields": [f for _, f, _, _ in string.Formatter().parse(rule["message"]) if f],
+            })
+        # Every field a batch needs for this rule set
+        self.fields = sorted({
+            field
+            for rule in self.rules
+            for field in [c["field"] for c in rule["when"] + rule["clear"]] + rule["message_fields"] + [rule["value"]]
+        })
+
+    def _compile(self, condition) -> dict:
+        field, op, threshold = condition
+        if op not in _OPS:
+            raise ValueError(f"Rule set {self.name}: unknown operator {op!r}")
+        if isinstance(threshold, dict):
+            if self.crop_params is None:
+                raise ValueError(f"Rule set {self.name}: {threshold['param']} needs crop_params")
+            if any(threshold["param"] not in params for params in self.crop_params.values()):
+                raise ValueError(f"Rule set {self.name}: not every crop defines {threshold['param']}")
+        return {"field": field, "op": _OPS[op], "threshold": threshold}
+
+    def _crop_thresholds(self, crops):
+        """param name -> per-row array, resolved once per distinct crop."""
+        if self.crop_params is None:
+            return {}
+        index, names = pd.factorize(np.asarray(crops, dtype=object))  # hash-based, one pass
+        default = self.crop_params[DEFAULT_CROP]
+        rows = [self.crop_params.get(str(name).lower(), default) for name in names]
+        return {
+            key: np.array([params[key] for params in rows], dtype=np.float64)[index]
+            for key in default
+        }
+
+    def _test(self, conditions, data: dict, thresholds: dict, n: int) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for condition in conditions:
+            threshold = condition["threshold"]
+            if isinstance(threshold, dict):
+                threshold = thresholds[threshold["param"]] * threshold["scale"] + threshold["offset"]
+            with np.errstate(invalid="ignore"):
+                mask &= condition["op"](data[condition["field"]], threshold)
+        return mask
+
+    def evaluate(self, data: dict, crops=None) -> dict:
+        """
+        data: field -> array (one row per reading, NaN where missing); crops: crop name per row
+        for rule sets with crop params. Returns rule name -> (raised mask, cleared mask).
+        A row neither raised nor cleared leaves that alert's state unchanged.
+        """
+        data = {field: np.asarray(values) for field, values in data.items()}
+        n = len(next(iter(data.values())))
+        thresholds = self._crop_thresholds(crops)
+
+        raised, taken = {}, {}
+        for rule in self.rules:
+            mask = self._test(rule["when"], data, thresholds, n)
+            group = rule["group"]
+            if group is not None:
+                # elif: only rows no earlier rule of the group took
+                mask &= ~taken.get(group, np.zeros(n, dtype=bool))
+                taken[group] = taken.get(group, np.zeros(n, dtype=bool)) | mask
+            raised[rule["name"]] = mask
+
+        results = {}
+        for rule in self.rules:
+            mask = raised[rule["name"]]
+            cleared = self._test(rule["clear"], data, thresholds, n) if rule["clear"] else np.zeros(n, dtype=bool)
+            if rule["group"] is not None:
+                cleared |= taken[rule["group"]] & ~mask
+            results[rule["name"]] = (mask, cleared & ~mask)
+        return results
+
+    def format(self, rule_name: str, data: dict, i: int) -> str:
+        rule = self.rule(rule_name)
+        return rule["message"].format(**{
+            f: float(data[f][i]) if isinstance(data[f][i], (float, np.floating)) else data[f][i]
+            for f in rule["message_fields"]
+        })
+
+    def rule(self, rule_name: str) -> dict:
+        for rule in self.rules:
+            if rule["name"] == rule_name:
+                return rule
+        raise KeyError(rule_name)
+
+    def messages(self, data: dict, crops=None) -> list:
+        """Messages of the rules that fire, per row (in rule order; the fallback where none do)."""
+        n = len(next(iter(data.values())))
+        results = self.evaluate(data, crops)
+        if any(rule["message_fields"] for rule in self.rules):
+            per_row = [[] for _ in range(n)]
+            for rule_name, (mask, _) in results.items():
+                for i in np.flatnonzero(mask):
+                    per_row[i].append(self.format(rule_name, data, i))
+        else:
+            # Fixed messages: build each distinct combination of fired rules once
+            combos = np.zeros(n, dtype=np.int64)
+            for bit, (mask, _) in enumerate(results.values()):
+                combos |= mask.astype(np.int64) << bit
+            unique, index = np.unique(combos, return_inverse=True)
+            lists = [
+                [rule["message"] for bit, rule in enumerate(self.rules) if combo >> bit & 1]
+                for combo in unique.tolist()
+            ]
+            per_row = [list(lists[i]) for i in index.tolist()]
+        if self.fallback is not None:
+            for row in per_row:
+                if not row:
+                    row.append(self.fallback)
+        return per_row
+
+
+rule_sets = {name: RuleSet(name, spec) for name, spec in RULE_SETS.items()}
+
+
+def generate_weather_alerts(crop, temp_flowering, rain_flowering, humidity) -> list:
+    """Flowering-stage weather alerts for one crop (see crop_weather_alerts for batches)."""
+    return crop_weather_alerts([crop], [temp_flowering], [rain_flowering], [humidity])[0]
+
+
+def crop_weather_alerts(crops, temp_flowering, rain_flowering, humidity) -> list:
+    """Flowering-stage weather alerts for many (crop, temperature, rainfall, humidity) rows at once."""
+    data = {
+        "temp_flowering": np.asarray(temp_flowering, dtype=np.float64),
+        "rain_flowering": np.asarray(rain_flowering, dtype=np.float64),
+        "humidity": np.asarray(humidity, dtype=np.float64),
+    }
+    return rule_sets["crop_flowering"].messages(data, crops)
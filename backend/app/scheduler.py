@@ -1,10 +1,37 @@
 import asyncio
+import os
+import time
+import uuid
+import socket
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .cache import LRUCache
 from .database import SessionLocal
-from .models import User, SensorLog
-from .manager import manager
+from .models import User, LatestSensorState, SchedulerLease
+from .alerts import alert_engine, sensor_observations, weather_observations, deliver_alerts
+from .rules import rule_sets
 import random
-import json
+
+# Users are split into SCHEDULER_SHARDS shards (user_id % shards). Each run, a worker leases
+# shards in the scheduler_leases table and only evaluates those, so N uvicorn workers don't
+# each scan everyone. Lease expiry uses the workers' clocks: keep hosts NTP-synced.
+SCHEDULER_SHARDS = max(1, int(os.getenv("SCHEDULER_SHARDS", 1)))
+SCHEDULER_MAX_SHARDS_PER_WORKER = int(os.getenv("SCHEDULER_MAX_SHARDS_PER_WORKER", 0)) or SCHEDULER_SHARDS
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", 90))
+# Weather is re-checked per shard at this interval; one forecast per geohash cell
+WEATHER_CHECK_INTERVAL_SECONDS = float(os.getenv("WEATHER_CHECK_INTERVAL_SECONDS", 1800))
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", 5))  # 5 chars ~ 4.9 x 4.9 km
+
+# Latest-state columns the sensor rules read (app/rules.py)
+SENSOR_RULE_FIELDS = rule_sets["sensor"].fields
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
 
 # Mock Weather Service (Replace with real API call like OpenWeatherMap)
 def get_weather_forecast(lat, lon):
@@ -16,45 +43,251 @@ def get_weather_forecast(lat, lon):
         "rain_prob": random.uniform(0, 100)
     }
 
-async def check_conditions_job():
-    print("⏰ Running 30-minute Weather & Moisture Check...")
+
+def geohash(lat: float, lon: float, precision: int = WEATHER_GEOHASH_PRECISION) -> str:
+    """Standard base-32 geohash of a point; nearby farms share a prefix (cell)."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+class SchedulerState:
+    """Per-cell forecast cache and counters for /metrics."""
+
+    def __init__(self):
+        self.forecasts = LRUCache(maxsize=100000, ttl=WEATHER_CHECK_INTERVAL_SECONDS)
+        self.runs = 0
+        self.shards_owned = []
+        self.last_dirty_users = 0
+        self.last_weather_users = 0
+        self.last_alerted_users = 0
+        self.last_duration_ms = 0.0
+
+    def forecast(self, cell: str, lat: float, lon: float) -> dict:
+        weather = self.forecasts.get(cell)
+        if weather is None:
+            weather = get_weather_forecast(lat, lon)
+            self.forecasts.put(cell, weather)
+        return weather
+
+    def stats(self) -> dict:
+        return {
+            "worker": WORKER_ID,
+            "shards": SCHEDULER_SHARDS,
+            "shards_owned": self.shards_owned,
+            "runs": self.runs,
+            "last_dirty_users": self.last_dirty_users,
+            "last_weather_users": self.last_weather_users,
+            "last_alerted_users": self.last_alerted_users,
+            "last_duration_ms": round(self.last_duration_ms, 1),
+            "weather_cells": self.forecasts.stats(),
+        }
+
+
+scheduler_state = SchedulerState()
+
+
+def acquire_shards(db: Session, now: datetime) -> list:
+    """Renew this worker's leases and claim free/expired shards, up to SCHEDULER_MAX_SHARDS_PER_WORKER."""
+    existing = {row.shard for row in db.query(SchedulerLease.shard)}
+    missing = [shard for shard in range(SCHEDULER_SHARDS) if shard not in existing]
+    if missing:
+        db.add_all(SchedulerLease(shard=shard) for shard in missing)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created them first
+
+    mine = sorted(
+        row.shard for row in db.query(SchedulerLease.shard).filter(SchedulerLease.owner == WORKER_ID)
+        if row.shard < SCHEDULER_SHARDS
+    )
+    others = [shard for shard in random.sample(range(SCHEDULER_SHARDS), SCHEDULER_SHARDS) if shard not in mine]
+    owned = []
+    for shard in mine + others:
+        if len(owned) >= SCHEDULER_MAX_SHARDS_PER_WORKER:
+            break
+        # Conditional UPDATE: only one worker can win an expired lease
+        claimed = db.query(SchedulerLease).filter(
+            SchedulerLease.shard == shard,
+            or_(
+                SchedulerLease.owner == WORKER_ID,
+                SchedulerLease.owner.is_(None),
+                SchedulerLease.expires_at.is_(None),
+                SchedulerLease.expires_at < now,
+            ),
+        ).update(
+            {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)},
+            synchronize_session=False,
+        )
+        db.commit()
+        if claimed:
+            owned.append(shard)
+    return sorted(owned)
+
+
+def release_shards():
+    """Give up this worker's leases on shutdown so another worker takes over without waiting for expiry."""
     db: Session = SessionLocal()
     try:
-        users = db.query(User).all()
-        for user in users:
-            alerts = []
-            
-            # 1. Check Weather (if location exists)
-            if user.lat and user.lon:
-                weather = get_weather_forecast(user.lat, user.lon)
-                
-                if weather["condition"] == "Storm":
-                    alerts.append(f"⚠️ STORM ALERT for {user.city}: Heavy rain expected. Delay irrigation.")
-                elif weather["condition"] == "Heatwave":
-                    alerts.append(f"🔥 HEATWAVE ALERT for {user.city}: High temps. Ensure sufficient irrigation.")
-                elif weather["rain_prob"] > 80:
-                    alerts.append(f"🌧️ RAIN FORECAST for {user.city}: 80% chance of rain. Skip irrigation today.")
-
-            # 2. Check Latest Moisture Reading
-            latest_log = db.query(SensorLog).filter(SensorLog.user_id == user.id).order_by(SensorLog.timestamp.desc()).first()
-            
-            if latest_log:
-                if latest_log.moisture < 30:
-                    alerts.append(f"💧 CRITICAL MOISTURE: Soil moisture is low ({latest_log.moisture}%). Turn on pump.")
-                elif latest_log.moisture > 90:
-                    alerts.append(f"💧 HIGH MOISTURE: Soil is saturated ({latest_log.moisture}%). Stop irrigation.")
-
-            # 3. Send Alerts via WebSocket
-            if alerts:
-                alert_data = {
-                    "user_id": user.id,
-                    "messages": alerts
-                }
-                json_message = json.dumps(alert_data)
-                print(f"🚀 Sending Alert to {user.name}: {json_message}")
-                await manager.broadcast(json_message)
-                    
-    except Exception as e:
-        print(f"❌ Scheduler Error: {e}")
+        db.query(SchedulerLease).filter(SchedulerLease.owner == WORKER_ID).update(
+            {"owner": None, "expires_at": None}, synchronize_session=False
+        )
+        db.commit()
     finally:
         db.close()
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def load_shard(db: Session, shard: int, weather_due: bool) -> dict:
+    """
+    The shard's users that need evaluating, as column arrays: users with a reading the
+    scheduler (or ingest) hasn't evaluated yet, plus (when weather is due) every user with a
+    location. Rows not being checked for one rule get NaN readings / empty condition.
+    """
+    active = or_(User.is_deleted.is_(None), User.is_deleted != 1)
+    in_shard = [User.id % SCHEDULER_SHARDS == shard] if SCHEDULER_SHARDS > 1 else []
+
+    rows = {}
+    dirty = db.query(
+        User.id, User.name, User.city, LatestSensorState.sensor_log_id,
+        *[getattr(LatestSensorState, field) for field in SENSOR_RULE_FIELDS],
+    ).join(
+        LatestSensorState, LatestSensorState.user_id == User.id
+    ).filter(
+        active, *in_shard,
+        or_(
+            LatestSensorState.evaluated_log_id.is_(None),
+            LatestSensorState.evaluated_log_id != LatestSensorState.sensor_log_id,
+        ),
+    ).all()
+    for row in dirty:
+        rows[row.id] = {
+            "name": row.name, "city": row.city, "seen_log_id": row.sensor_log_id,
+            **{f: np.nan if getattr(row, f) is None else getattr(row, f) for f in SENSOR_RULE_FIELDS},
+            "condition": "", "rain_prob": np.nan,
+        }
+
+    if weather_due:
+        located = db.query(User.id, User.name, User.city, User.lat, User.lon).filter(
+            active, *in_shard,
+            User.lat.isnot(None), User.lon.isnot(None), User.lat != 0, User.lon != 0,
+        ).all()
+        for row in located:
+            weather = scheduler_state.forecast(geohash(row.lat, row.lon), row.lat, row.lon)
+            entry = rows.setdefault(row.id, {
+                "name": row.name, "city": row.city, "seen_log_id": None,
+                **{f: np.nan for f in SENSOR_RULE_FIELDS},
+            })
+            entry["condition"] = weather["condition"]
+            entry["rain_prob"] = weather["rain_prob"]
+
+    user_ids = sorted(rows)
+    return {
+        "user_id": np.array(user_ids, dtype=np.int64),
+        "name": [rows[uid]["name"] for uid in user_ids],
+        "city": [rows[uid]["city"] for uid in user_ids],
+        "seen_log_id": [rows[uid]["seen_log_id"] for uid in user_ids],
+        **{f: np.array([rows[uid][f] for uid in user_ids], dtype=np.float64) for f in SENSOR_RULE_FIELDS},
+        "condition": np.array([rows[uid]["condition"] for uid in user_ids], dtype=object),
+        "rain_prob": np.array([rows[uid]["rain_prob"] for uid in user_ids], dtype=np.float64),
+        "dirty_users": len(dirty),
+        "weather_users": len(located) if weather_due else 0,
+    }
+
+
+def evaluate_alerts(db: Session, snapshot: dict, now: datetime) -> dict:
+    """
+    Run the weather and sensor rules over the whole snapshot at once and feed the results to
+    the alert engine, which only notifies on changes -> {user_id: [messages]}.
+    """
+    if len(snapshot["user_id"]) == 0:
+        return {}
+    user_ids = snapshot["user_id"]
+    observations = weather_observations(user_ids, snapshot["city"], snapshot["condition"], snapshot["rain_prob"])
+    # NaN (reading not re-evaluated) neither raises nor clears
+    observations += sensor_observations(user_ids, {f: snapshot[f] for f in SENSOR_RULE_FIELDS})
+    return alert_engine.apply(db, observations, now)
+
+
+def evaluate_shard(db: Session, shard: int, now: datetime) -> dict:
+    """Evaluate one leased shard and record what was evaluated (and the alert states), in one transaction."""
+    lease = db.get(SchedulerLease, shard)
+    weather_due = lease.weather_checked_at is None or (
+        now - _utc(lease.weather_checked_at)
+    ).total_seconds() >= WEATHER_CHECK_INTERVAL_SECONDS
+
+    snapshot = load_shard(db, shard, weather_due)
+    alerts = evaluate_alerts(db, snapshot, now)
+
+    # Remember the reading each user was evaluated at; a newer one arriving meanwhile keeps them dirty
+    seen = [
+        {"user_id": int(uid), "evaluated_log_id": log_id}
+        for uid, log_id in zip(snapshot["user_id"], snapshot["seen_log_id"]) if log_id is not None
+    ]
+    if seen:
+        db.execute(update(LatestSensorState), seen)
+    if weather_due:
+        lease.weather_checked_at = now
+    db.commit()
+
+    scheduler_state.last_dirty_users += snapshot["dirty_users"]
+    scheduler_state.last_weather_users += snapshot["weather_users"]
+    return alerts
+
+
+def collect_alerts() -> dict:
+    """Lease shards, then evaluate changed users (and weather when due) in each. Blocking; run in the thread pool."""
+    db: Session = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        scheduler_state.last_dirty_users = scheduler_state.last_weather_users = 0
+        scheduler_state.shards_owned = acquire_shards(db, now)
+        alerts = {}
+        for shard in scheduler_state.shards_owned:
+            alerts.update(evaluate_shard(db, shard, now))
+        return alerts
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def check_conditions_job():
+    started = time.perf_counter()
+    try:
+        alerts = await run_in_threadpool(collect_alerts)
+
+        # Send Alerts via WebSocket, only to the sockets of each alerted user
+        await deliver_alerts(alerts)
+
+        state = scheduler_state
+        state.runs += 1
+        state.last_alerted_users = len(alerts)
+        state.last_duration_ms = (time.perf_counter() - started) * 1000
+        if state.shards_owned and (state.last_dirty_users or state.last_weather_users):
+            print(
+                f"⏰ Alert check (shards {state.shards_owned}): {state.last_dirty_users} changed, "
+                f"{state.last_weather_users} weather-checked, {len(alerts)} notified in {state.last_duration_ms:.0f}ms"
+            )
+
+    except Exception as e:
+        print(f"❌ Scheduler Error: {e}")
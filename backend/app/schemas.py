@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 
@@ -49,6 +49,49 @@ class SensorData(SensorBase):
     device_id: str
 
 
+class SensorReading(SensorBase):
+    ts: datetime  # device clock; naive values are taken as UTC, integers as epoch seconds
+
+
+class SensorBatch(BaseModel):
+    """
+    Readings a device buffered while offline. Either a list of objects in `readings`, or the
+    compact columnar form: {"device_id": ..., "columns": ["ts", "moisture", ...], "rows": [[...], ...]}.
+    """
+    device_id: str
+    readings: List[SensorReading] = []
+
+    @model_validator(mode="before")
+    @classmethod
+    def expand_rows(cls, values):
+        if isinstance(values, dict) and "rows" in values:
+            columns = values.get("columns") or []
+            values = {**values, "readings": [dict(zip(columns, row)) for row in values["rows"] or []]}
+        return values
+
+
+class SensorBatchAck(BaseModel):
+    device_id: str
+    received: int
+    rows_inserted: int  # readings x users bound to the device
+    rows_skipped: int   # already stored (re-sent readings)
+
+
+class SensorAck(BaseModel):
+    status: str
+    device_id: str
+    users: int
+    timestamp: datetime
+
+
+class SensorHistoryOut(BaseModel):
+    resolution: str  # "raw", "1m", "1h" or "1d"
+    start: datetime
+    end: datetime
+    metrics: List[str]
+    points: List[Dict[str, Any]]  # {"t": ..., "<metric>": {"mean", "min", "max", "count"}}
+
+
 class SensorLogOut(SensorBase):
     id: int
     timestamp: datetime
@@ -129,6 +172,26 @@ class FertilizerRecommendationOutput(BaseModel):
     unit: str = "kg/ha"
 
 
+class FertilizerBatchInput(BaseModel):
+    # Rows are validated one by one so a single bad field doesn't reject the whole batch
+    items: list[dict]
+
+
+class FertilizerBatchItemOut(BaseModel):
+    index: int
+    recommended_N: Optional[float] = None
+    recommended_P: Optional[float] = None
+    recommended_K: Optional[float] = None
+    unit: str = "kg/ha"
+    error: Optional[str] = None
+
+
+class FertilizerBatchOutput(BaseModel):
+    results: list[FertilizerBatchItemOut]
+    succeeded: int
+    failed: int
+
+
 class KrishiChatInput(BaseModel):
     session_id: str
     query: str
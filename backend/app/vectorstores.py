@@ -0,0 +1,208 @@
+import os
+import re
+import pickle
+import hashlib
+import asyncio
+import threading
+import unicodedata
+from functools import lru_cache
+
+from .cache import LRUCache
+
+DISEASE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DISEASE_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faiss_disease_index")
+
+# LangChain / FAISS are imported inside the loaders so importing this module (e.g. for
+# /metrics) stays cheap.
+#
+# One embedding model / FAISS index per process, shared by every caller.
+# Indexes are memory-mapped where FAISS supports it, so their pages live in the OS
+# page cache and are shared between all workers on the host instead of being copied
+# into each process' heap.
+_lock = threading.Lock()
+_key_locks = {}
+_embeddings = {}
+_vectorstores = {}
+
+
+# Query-side caches. Disease queries are templated over a few dozen classes, so almost
+# every embedding / top-k lookup repeats. Embeddings are keyed on (model, normalized text);
+# retrieval results additionally on the index path + version, so rebuilding an index
+# never serves stale documents.
+query_embedding_cache = LRUCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096)),
+)
+retrieval_cache = LRUCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", 3600)) or None,
+)
+
+
+def normalize_query(text: str) -> str:
+    # Whitespace/Unicode normalization only: the multilingual model is cased, so case is kept
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def index_version(index_dir: str) -> str:
+    """
+    Content hash of the saved index files, so every host with the same index computes the same
+    version however the files got there (checkout, download at boot, another volume).
+    """
+    digest = hashlib.sha256()
+    for name in ("index.faiss", "index.pkl"):
+        digest.update(name.encode())
+        try:
+            with open(os.path.join(index_dir, name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        except OSError:
+            digest.update(b"missing")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _cached_classes():
+    from langchain_core.embeddings import Embeddings
+    from langchain_community.vectorstores import FAISS
+
+    class CachedEmbeddings(Embeddings):
+        """Wraps a shared embedding model; `embed_query` goes through `query_embedding_cache`."""
+
+        def __init__(self, inner, model_name: str):
+            self.inner = inner
+            self.model_name = model_name
+
+        def embed_documents(self, texts):
+            return self.inner.embed_documents(texts)
+
+        def embed_query(self, text):
+            key = (self.model_name, normalize_query(text))
+            vector = query_embedding_cache.get(key)
+            if vector is None:
+                vector = self.inner.embed_query(text)
+                query_embedding_cache.put(key, vector)
+            return vector
+
+    class CachedFAISS(FAISS):
+        """FAISS store whose plain top-k searches are memoized in `retrieval_cache`."""
+
+        index_key = None
+
+        def similarity_search(self, query, k=4, filter=None, fetch_k=20, **kwargs):
+            if filter is not None or kwargs or self.index_key is None:
+                return super().similarity_search(query, k=k, filter=filter, fetch_k=fetch_k, **kwargs)
+            key = (self.index_key, normalize_query(query), k, fetch_k)
+            docs = retrieval_cache.get(key)
+            if docs is None:
+                docs = super().similarity_search(query, k=k, fetch_k=fetch_k)
+                retrieval_cache.put(key, docs)
+            return list(docs)
+
+        async def asimilarity_search(self, query, k=4, filter=None, fetch_k=20, **kwargs):
+            return await asyncio.to_thread(self.similarity_search, query, k, filter, fetch_k, **kwargs)
+
+    return CachedEmbeddings, CachedFAISS
+
+
+def _lock_for(key: str) -> threading.Lock:
+    # Per-item locks: two different models/indexes can load in parallel, the same one only once
+    with _lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def get_embeddings(model_name: str):
+    """Load `model_name` once per process and hand out the shared (query-cached) instance."""
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    with _lock_for(f"embeddings:{model_name}"):
+        if model_name not in _embeddings:
+            CachedEmbeddings, _ = _cached_classes()
+            _embeddings[model_name] = CachedEmbeddings(HuggingFaceEmbeddings(model_name=model_name), model_name)
+            print(f"✅ Embedding model loaded: {model_name}")
+        return _embeddings[model_name]
+
+
+def _make_store(index_dir: str, embeddings, index, docstore, index_to_docstore_id, version: str):
+    _, CachedFAISS = _cached_classes()
+    store = CachedFAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    store.index_key = (os.path.abspath(index_dir), version)
+    return store
+
+
+def _read_index(index_file: str):
+    import faiss
+
+    # Newer FAISS can also map flat-index codes (IO_FLAG_MMAP_IFC); IO_FLAG_MMAP covers inverted lists
+    flags = [getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP]
+    for flag in [f for f in flags if f is not None]:
+        try:
+            return faiss.read_index(index_file, flag), "mmap"
+        except Exception as e:
+            print(f"⚠️ FAISS mmap load not supported for {index_file}: {e}")
+    return faiss.read_index(index_file), "in-memory"
+
+
+def load_faiss_index(index_dir: str, model_name: str):
+    """
+    Load a LangChain FAISS index saved with `save_local` once per process.
+    The returned store is shared: treat it as read-only (no add_texts / merge_from).
+    """
+    key = os.path.abspath(index_dir)
+    with _lock_for(f"index:{key}"):
+        if key in _vectorstores:
+            return _vectorstores[key]["store"]
+
+        embeddings = get_embeddings(model_name)
+        version = index_version(index_dir)
+        index, mode = _read_index(os.path.join(index_dir, "index.faiss"))
+        # Same layout FAISS.save_local writes: (docstore, index_to_docstore_id)
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        store = _make_store(index_dir, embeddings, index, docstore, index_to_docstore_id, version)
+        _vectorstores[key] = {"store": store, "model_name": model_name, "mode": mode, "version": version}
+        print(f"✅ FAISS index loaded ({mode}) from {index_dir}")
+        return store
+
+
+def register_vectorstore(index_dir: str, model_name: str, store):
+    """Share an index that was just built in-process (e.g. first run without a saved index)."""
+    key = os.path.abspath(index_dir)
+    with _lock_for(f"index:{key}"):
+        version = index_version(index_dir)
+        shared = _make_store(index_dir, get_embeddings(model_name), store.index, store.docstore,
+                             store.index_to_docstore_id, version)
+        _vectorstores[key] = {"store": shared, "model_name": model_name, "mode": "in-memory", "version": version}
+        return shared
+
+
+def get_index_version(index_dir: str) -> str:
+    """Version of the index currently loaded for `index_dir` (falls back to the files on disk)."""
+    entry = _vectorstores.get(os.path.abspath(index_dir))
+    return entry["version"] if entry else index_version(index_dir)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "embedding_models": sorted(_embeddings),
+            "indexes": {
+                path: {
+                    "model_name": entry["model_name"],
+                    "mode": entry["mode"],
+                    "version": entry["version"],
+                    "vectors": int(entry["store"].index.ntotal),
+                }
+                for path, entry in _vectorstores.items()
+            },
+            "query_embedding_cache": query_embedding_cache.stats(),
+            "retrieval_cache": retrieval_cache.stats(),
+        }
@@ -0,0 +1,61 @@
+"""
+Rebuild sensor_rollups (1m/1h/1d min/max/mean used by /iot/history) and latest_sensor_state
+(newest reading per user, used by /iot/latest and the scheduler) from raw sensor_logs.
+
+Both are maintained on ingest; run this once after upgrading to fill in history recorded
+before they existed, or to repair them. It deletes and recomputes them (all users, or
+--user-id), so run it while ingest is stopped.
+
+Usage (from backend/):
+    python backfill_rollups.py
+    python backfill_rollups.py --user-id 42
+"""
+import time
+import argparse
+
+from app.database import SessionLocal, sync_schema
+from app.models import Base, SensorLog, SensorRollup
+from app.ingest import SENSOR_FIELDS
+from app.rollups import upsert_rollups
+from app.latest_state import rebuild_latest_state
+
+
+def backfill(user_id=None, chunk_rows=20000):
+    sync_schema(Base.metadata)
+    db = SessionLocal()
+    try:
+        deleted = db.query(SensorRollup)
+        if user_id is not None:
+            deleted = deleted.filter(SensorRollup.user_id == user_id)
+        print(f"🧹 Removed {deleted.delete(synchronize_session=False)} existing rollup rows")
+
+        columns = [SensorLog.id, SensorLog.user_id, SensorLog.timestamp] + [getattr(SensorLog, f) for f in SENSOR_FIELDS]
+        started = time.perf_counter()
+        last_id, total = 0, 0
+        while True:
+            query = db.query(*columns).filter(SensorLog.id > last_id)
+            if user_id is not None:
+                query = query.filter(SensorLog.user_id == user_id)
+            rows = [row._mapping for row in query.order_by(SensorLog.id).limit(chunk_rows).all()]
+            if not rows:
+                break
+            upsert_rollups(db, rows, SENSOR_FIELDS)
+            last_id = rows[-1]["id"]
+            total += len(rows)
+            print(f"  {total} readings rolled up ({total / (time.perf_counter() - started):.0f}/s)")
+        print(f"📌 Latest state rebuilt for {rebuild_latest_state(db, user_id)} users")
+        db.commit()
+        print(f"✅ Rollups and latest state rebuilt from {total} readings")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="Only rebuild this user's rollups")
+    parser.add_argument("--chunk-rows", type=int, default=20000)
+    args = parser.parse_args()
+    backfill(args.user_id, args.chunk_rows)
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: legacy full-resolution preprocess vs app.image_preprocessing (draft() decode).
+
+Uses --image files if given, otherwise synthesizes JPEGs at typical phone resolutions.
+Reports per-image latency for both paths and the mean/max absolute pixel difference
+between their outputs (values are in [0, 1]).
+
+Usage (from backend/):
+    python bench_preprocess.py
+    python bench_preprocess.py --image leaf1.jpg --image leaf2.jpg --repeat 20
+"""
+import io
+import time
+import argparse
+import statistics
+import numpy as np
+from PIL import Image
+
+from app.image_preprocessing import preprocess_image, preprocess_into, allocate_batch
+
+
+def legacy_preprocess_image(file_bytes: bytes) -> np.ndarray:
+    """The original app.routers.disease.preprocess_image."""
+    img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
+    img = img.resize((224, 224))
+    img_array = np.array(img, dtype=np.float32) / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        128 + 100 * np.sin(xx / 97.0),
+        150 + 80 * np.cos(yy / 61.0),
+        90 + 60 * np.sin((xx + yy) / 143.0),
+    ], axis=-1)
+    noise = rng.normal(0, 12, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def time_fn(fn, data: bytes, repeat: int) -> list:
+    fn(data)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(data)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main(args):
+    if args.image:
+        inputs = []
+        for path in args.image:
+            with open(path, "rb") as f:
+                inputs.append((path, f.read()))
+    else:
+        inputs = [(f"synthetic {w}x{h}", synthetic_jpeg(w, h)) for w, h in [(1600, 1200), (4000, 3000), (4624, 3468)]]
+
+    for label, data in inputs:
+        legacy = time_fn(legacy_preprocess_image, data, args.repeat)
+        fast = time_fn(preprocess_image, data, args.repeat)
+        diff = np.abs(legacy_preprocess_image(data) - preprocess_image(data))
+        print(
+            f"{label} ({len(data) / 1e6:.1f} MB): "
+            f"legacy p50={statistics.median(legacy) * 1000:.1f}ms  "
+            f"draft p50={statistics.median(fast) * 1000:.1f}ms  "
+            f"speedup={statistics.median(legacy) / statistics.median(fast):.1f}x  "
+            f"|diff| mean={diff.mean():.4f} max={diff.max():.4f}"
+        )
+
+    # Batch path: all inputs decoded into one preallocated buffer
+    buffer = allocate_batch(len(inputs))
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for i, (_, data) in enumerate(inputs):
+            preprocess_into(buffer, i, data)
+    per_image = (time.perf_counter() - started) / (args.repeat * len(inputs))
+    print(f"preprocess_into batch of {len(inputs)}: {per_image * 1000:.1f}ms/image")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", action="append", help="Image file to benchmark (repeatable)")
+    parser.add_argument("--repeat", type=int, default=10)
+    main(parser.parse_args())
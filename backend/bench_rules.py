@@ -0,0 +1,135 @@
+"""
+Benchmark: evaluating the alert rules (app/rules.py) over --readings readings.
+
+For the per-crop flowering rules and the field-sensor rules, compares the old per-record
+Python if-chains (as they were in routers/krishi_saathi.py and the alert paths) with the
+compiled rule sets evaluated over the whole batch as NumPy masks. The vectorized results
+are checked against the per-record ones on a sample. "with messages" also builds each
+row's message list, which costs Python time per firing row.
+
+Usage (from backend/):
+    python bench_rules.py --readings 1000000
+"""
+import os
+import time
+import argparse
+import statistics
+import numpy as np
+
+os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/bench_rules.db")
+
+
+def legacy_crop_alerts(rules_by_crop: dict, crop, temp_flowering, rain_flowering, humidity) -> list:
+    """The old generate_weather_alerts if-chain, one record at a time."""
+    crop = crop.lower()
+    rules = rules_by_crop.get(crop, rules_by_crop["soybean"])
+    alerts = []
+
+    if temp_flowering >= rules["max_temp_flowering"] + 3:
+        alerts.append("🔥 Severe heat at flowering → high risk of flower drop.")
+    elif temp_flowering >= rules["max_temp_flowering"]:
+        alerts.append("🌡️ High temperature at flowering → moderate heat stress risk.")
+
+    if rain_flowering <= 0.5 * rules["min_rain_flowering"]:
+        alerts.append("💧 Very low rainfall during flowering → severe moisture stress.")
+    elif rain_flowering <= rules["min_rain_flowering"]:
+        alerts.append("💧 Low rainfall during flowering → moisture stress risk.")
+
+    if humidity >= rules["max_humidity"] + 5:
+        alerts.append("🦠 Very high humidity → strong risk of fungal diseases.")
+    elif humidity >= rules["max_humidity"]:
+        alerts.append("🦠 High humidity → increased probability of foliar diseases.")
+
+    if temp_flowering >= rules["max_temp_flowering"] and rain_flowering <= rules["min_rain_flowering"]:
+        alerts.append("⚠️ Combination of high temperature and low rainfall at flowering.")
+
+    if not alerts:
+        alerts.append("✅ No major weather red-flags detected.")
+    return alerts
+
+
+def legacy_sensor_alerts(moisture, temperature) -> list:
+    """Per-reading threshold checks, as the ingest and scheduler paths did them."""
+    alerts = []
+    if moisture is not None and moisture < 30:
+        alerts.append("moisture_low")
+    if moisture is not None and moisture > 90:
+        alerts.append("moisture_high")
+    if temperature is not None and temperature > 40:
+        alerts.append("temperature_high")
+    return alerts
+
+
+def timed(label: str, fn, repeat: int, n: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    median = statistics.median(samples)
+    print(f"  {label:<34} median {median:8.3f}s  ({n / median / 1e6:7.2f}M readings/s)")
+    return median, result
+
+
+def main(args):
+    from app.rules import CROP_ALERT_RULES, rule_sets, crop_weather_alerts
+
+    n = args.readings
+    rng = np.random.default_rng(42)
+    crop_names = np.array(list(CROP_ALERT_RULES) + ["wheat"])  # one crop without params (default)
+    crops = crop_names[rng.integers(0, len(crop_names), n)]
+    temp = rng.uniform(20, 42, n).round(1)
+    rain = rng.uniform(0, 60, n).round(1)
+    humidity = rng.uniform(60, 98, n).round(1)
+    moisture = rng.uniform(0, 100, n).round(1)
+    sensor_temp = rng.uniform(15, 45, n).round(1)
+    moisture[rng.random(n) < 0.05] = np.nan  # readings without the metric
+
+    print(f"{n:,} readings, {len(crop_names)} crops")
+
+    print("Crop flowering rules:")
+    crop_list, temp_list, rain_list, humidity_list = crops.tolist(), temp.tolist(), rain.tolist(), humidity.tolist()
+    legacy, legacy_result = timed(
+        "per-record if-chain (old)",
+        lambda: [
+            legacy_crop_alerts(CROP_ALERT_RULES, c, t, r, h)
+            for c, t, r, h in zip(crop_list, temp_list, rain_list, humidity_list)
+        ],
+        args.legacy_repeat, n,
+    )
+    rules = rule_sets["crop_flowering"]
+    data = {"temp_flowering": temp, "rain_flowering": rain, "humidity": humidity}
+    masks, _ = timed("compiled rules (masks)", lambda: rules.evaluate(data, crops), args.repeat, n)
+    messages, vector_result = timed(
+        "compiled rules (with messages)", lambda: crop_weather_alerts(crops, temp, rain, humidity), args.repeat, n
+    )
+    sample = rng.choice(n, min(n, 100_000), replace=False)
+    assert all(legacy_result[i] == vector_result[i] for i in sample), "vectorized results differ"
+    print(f"  speedup: masks {legacy / masks:.0f}x, with messages {legacy / messages:.1f}x")
+
+    print("Sensor rules:")
+    moisture_list = [None if np.isnan(m) else m for m in moisture.tolist()]
+    sensor_temp_list = sensor_temp.tolist()
+    legacy, legacy_result = timed(
+        "per-record if-chain (old)",
+        lambda: [legacy_sensor_alerts(m, t) for m, t in zip(moisture_list, sensor_temp_list)],
+        args.legacy_repeat, n,
+    )
+    sensor = rule_sets["sensor"]
+    readings = {"moisture": moisture, "temperature": sensor_temp}
+    vector, results = timed("compiled rules (masks)", lambda: sensor.evaluate(readings), args.repeat, n)
+    fired = [[] for _ in sample]
+    for name, (raised, _) in results.items():
+        for j, i in enumerate(sample):
+            if raised[i]:
+                fired[j].append(name)
+    assert all(legacy_result[i] == fired[j] for j, i in enumerate(sample)), "vectorized results differ"
+    print(f"  speedup: {legacy / vector:.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--legacy-repeat", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+"""
+Benchmark: alert fan-out latency vs number of websocket connections, with a few slow clients.
+
+Runs in-process against app.manager with simulated sockets (no network): each send takes
+--send-ms, except --slow-fraction of the clients (2G phones) that take --slow-ms per frame.
+For each connection count it sends one alert to every user and reports
+
+  * fan-out time: how long the caller (scheduler / ingest) is blocked
+  * delivery p50/p99 to the fast clients
+
+first for the old behaviour (sends awaited one after another), then for the per-socket
+queues. With queues the caller's time stays flat and slow clients only delay themselves.
+
+Usage (from backend/):
+    python bench_ws_fanout.py --connections 100 1000 10000
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+os.environ.setdefault("WS_SEND_TIMEOUT_SECONDS", "30")
+
+
+class SimulatedSocket:
+    def __init__(self, delay: float, delivered: list):
+        self.delay = delay
+        self.delivered = delivered
+        self.slow = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        if not self.slow:
+            self.delivered.append(time.perf_counter())
+
+    async def close(self):
+        pass
+
+
+def make_sockets(n: int, args, delivered: list) -> list:
+    every = max(1, round(1 / args.slow_fraction)) if args.slow_fraction else 0
+    sockets = []
+    for i in range(n):
+        slow = bool(every) and i % every == 0
+        socket = SimulatedSocket((args.slow_ms if slow else args.send_ms) / 1000, delivered)
+        socket.slow = slow
+        sockets.append(socket)
+    return sockets
+
+
+def summarize(label: str, n: int, blocked: float, started: float, delivered: list):
+    waits = sorted(t - started for t in delivered)
+    if not waits:
+        print(f"  {label:<8} {n:>7,}  blocked {blocked * 1000:9.1f} ms  (nothing delivered)")
+        return
+    p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+    print(
+        f"  {label:<8} {n:>7,}  blocked {blocked * 1000:9.1f} ms  "
+        f"delivery p50 {statistics.median(waits) * 1000:9.1f} ms  p99 {p99 * 1000:9.1f} ms"
+    )
+
+
+async def serial(n: int, args):
+    """The old broadcast: one awaited send after another."""
+    delivered = []
+    sockets = make_sockets(n, args, delivered)
+    started = time.perf_counter()
+    for user_id, socket in enumerate(sockets):
+        await socket.send_text(f'{{"user_id": {user_id}, "messages": ["alert"]}}')
+    summarize("serial", n, time.perf_counter() - started, started, delivered)
+
+
+async def queued(n: int, args):
+    from app.manager import ConnectionManager
+
+    manager = ConnectionManager()
+    delivered = []
+    sockets = make_sockets(n, args, delivered)
+    for user_id, socket in enumerate(sockets):
+        await manager.connect(socket, user_id)
+
+    started = time.perf_counter()
+    await manager.send_to_users((user_id, f'{{"user_id": {user_id}, "messages": ["alert"]}}') for user_id in range(n))
+    blocked = time.perf_counter() - started
+    fast = n - sum(socket.slow for socket in sockets)
+    while len(delivered) < fast:
+        await asyncio.sleep(0.005)
+    summarize("queued", n, blocked, started, delivered)
+    await manager.shutdown()
+
+
+async def main(args):
+    print(f"send {args.send_ms} ms, {args.slow_fraction:.0%} of clients at {args.slow_ms} ms per frame")
+    for n in args.connections:
+        if n <= args.serial_max:
+            await serial(n, args)
+        await queued(n, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--send-ms", type=float, default=1.0)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.01)
+    parser.add_argument("--serial-max", type=int, default=1000, help="Skip the serial run above this many connections")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,252 @@
+"""
+Convert the Keras disease CNN (.h5) to ONNX and/or TFLite for app/disease_backends, then
+report parity, latency and memory against the Keras model on a held-out image set.
+
+The converted files are written next to the .h5 with the same stem (plant_disease_model.onnx,
+plant_disease_model.tflite), which is where app.model_loaders looks for them. With --int8 the
+weights and activations are quantized, calibrated on --calibration-dir images.
+
+Held-out images may sit in one folder per class (folder name = class name from
+class_indices.json) to also report top-1 accuracy; a flat folder reports agreement only.
+Every backend is measured in a fresh process so peak memory is not shared between them.
+
+Requires: tensorflow, plus tf2onnx + onnxruntime for ONNX.
+
+Usage (from backend/):
+    python convert_disease_model.py --heldout-dir data/leaves_val
+    python convert_disease_model.py --format tflite --int8 --calibration-dir data/leaves_train --heldout-dir data/leaves_val
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import multiprocessing
+from queue import Empty
+import numpy as np
+
+from app.model_loaders import DISEASE_CNN_PATHS, load_keras_model
+from app.disease_backends import BACKENDS
+from app.image_preprocessing import allocate_batch, preprocess_into
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+CLASS_INDICES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "models", "class_indices.json")
+
+
+def list_images(directory: str, limit: int = None) -> list:
+    """Returns [(path, folder name)] sorted by path, at most `limit` spread evenly over the set."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append((os.path.join(root, name), os.path.basename(root)))
+    found.sort()
+    if limit and len(found) > limit:
+        step = len(found) / limit
+        found = [found[int(i * step)] for i in range(limit)]
+    return found
+
+
+def load_images(paths: list) -> np.ndarray:
+    batch = allocate_batch(len(paths))
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            preprocess_into(batch, i, f.read())
+    return batch
+
+
+def convert_tflite(model, out_path: str, calibration: np.ndarray = None) -> str:
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([calibration[i:i + 1]] for i in range(len(calibration)))
+        # Full-integer kernels; input/output stay float so callers don't change
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    return out_path
+
+
+def convert_onnx(model, out_path: str, calibration: np.ndarray = None, opset: int = 13) -> str:
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    if calibration is None:
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=out_path)
+        return out_path
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._rows = iter(range(len(calibration)))
+
+        def get_next(self):
+            i = next(self._rows, None)
+            return None if i is None else {"input": calibration[i:i + 1]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.onnx")
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=float_path)
+        quantize_static(
+            float_path, out_path, Reader(),
+            quant_format=QuantFormat.QDQ, per_channel=True,
+            activation_type=QuantType.QInt8, weight_type=QuantType.QInt8,
+        )
+    return out_path
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _measure(backend: str, model_path: str, images_path: str, latency_images: int, batch_size: int, queue):
+    """Child process: load one backend, score the held-out set, time batch-1 and batched calls."""
+    try:
+        images = np.load(images_path)
+        rss_before = _peak_rss_mb()
+        started = time.perf_counter()
+        model = load_keras_model(model_path) if backend == "keras" else BACKENDS[backend](model_path)
+        load_seconds = time.perf_counter() - started
+
+        probs = np.concatenate([
+            model.predict(images[i:i + batch_size], verbose=0) for i in range(0, len(images), batch_size)
+        ])
+
+        single = []
+        for i in range(min(latency_images, len(images))):
+            started = time.perf_counter()
+            model.predict(images[i:i + 1], verbose=0)
+            single.append(time.perf_counter() - started)
+
+        chunk = images[:batch_size]
+        started = time.perf_counter()
+        for _ in range(3):
+            model.predict(chunk, verbose=0)
+        per_image_batched = (time.perf_counter() - started) / (3 * len(chunk))
+
+        single.sort()
+        queue.put({
+            "probs": probs,
+            "load_s": load_seconds,
+            "p50_ms": statistics.median(single) * 1000,
+            "p95_ms": single[min(len(single) - 1, int(len(single) * 0.95))] * 1000,
+            "batched_ms_per_image": per_image_batched * 1000,
+            "peak_rss_mb": _peak_rss_mb() - rss_before,
+        })
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure(backend: str, model_path: str, images_path: str, latency_images: int, batch_size: int,
+            timeout: float) -> dict:
+    """Run _measure in a fresh process; a child that crashes or hangs is reported as a failed backend."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(backend, model_path, images_path, latency_images, batch_size, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if not proc.is_alive():
+                # Killed (e.g. out of memory) or crashed in native code before reporting
+                result = {"error": f"worker exited with code {proc.exitcode} without a result"}
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = {"error": f"no result within {timeout:.0f}s (--measure-timeout)"}
+    proc.join()
+    return result
+
+
+def report(results: dict, labels: np.ndarray):
+    reference = results["keras"].get("probs")
+    print(f"\n{'backend':<8} {'top1 agree':>10} {'max|Δp|':>8} {'accuracy':>9} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'batch ms/img':>12} {'load s':>7} {'peak MB':>8}")
+    for backend, r in results.items():
+        if "error" in r:
+            print(f"{backend:<8} failed: {r['error']}")
+            continue
+        top1 = r["probs"].argmax(axis=1)
+        agree = float(np.mean(top1 == reference.argmax(axis=1))) if reference is not None else float("nan")
+        max_diff = float(np.abs(r["probs"] - reference).max()) if reference is not None else float("nan")
+        known = labels >= 0
+        accuracy = f"{np.mean(top1[known] == labels[known]):.4f}" if known.any() else "n/a"
+        print(f"{backend:<8} {agree:>10.4f} {max_diff:>8.4f} {accuracy:>9} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f} "
+              f"{r['batched_ms_per_image']:>12.1f} {r['load_s']:>7.1f} {r['peak_rss_mb']:>8.0f}")
+
+
+def main(args):
+    model_path = args.model or next((p for p in DISEASE_CNN_PATHS if os.path.exists(p)), None)
+    if not model_path or not os.path.exists(model_path):
+        sys.exit("❌ Disease CNN .h5 not found; pass --model")
+    stem = os.path.splitext(model_path)[0]
+    formats = [f.strip() for f in args.format.split(",") if f.strip()]
+
+    calibration = None
+    if args.int8:
+        if not args.calibration_dir:
+            sys.exit("❌ --int8 needs --calibration-dir (sample images, not the held-out set)")
+        calibration = load_images([p for p, _ in list_images(args.calibration_dir, args.calibration_images)])
+        print(f"Calibrating int8 on {len(calibration)} images from {args.calibration_dir}")
+
+    model = load_keras_model(model_path)
+    converted = {}
+    for fmt in formats:
+        out_path = f"{stem}.{fmt}"
+        convert = {"onnx": convert_onnx, "tflite": convert_tflite}[fmt]
+        started = time.perf_counter()
+        convert(model, out_path, calibration)
+        size_mb = os.path.getsize(out_path) / 1e6
+        print(f"✅ {fmt}{' int8' if args.int8 else ''} written to {out_path} ({size_mb:.1f} MB, {time.perf_counter() - started:.0f}s)")
+        converted[fmt] = out_path
+    del model
+
+    if not args.heldout_dir:
+        print("No --heldout-dir given; skipping parity/latency report.")
+        return
+
+    heldout = list_images(args.heldout_dir, args.max_images)
+    if not heldout:
+        sys.exit(f"❌ No images found in {args.heldout_dir}")
+    class_to_idx = {}
+    if os.path.exists(args.class_indices):
+        with open(args.class_indices) as f:
+            class_to_idx = {name: int(idx) for idx, name in json.load(f).items()}
+    labels = np.array([class_to_idx.get(folder, -1) for _, folder in heldout])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images_path = os.path.join(tmp, "heldout.npy")
+        np.save(images_path, load_images([p for p, _ in heldout]))
+        print(f"Held-out set: {len(heldout)} images ({int((labels >= 0).sum())} labelled)")
+
+        results = {"keras": measure(
+            "keras", model_path, images_path, args.latency_images, args.batch_size, args.measure_timeout
+        )}
+        for fmt, path in converted.items():
+            results[fmt] = measure(fmt, path, images_path, args.latency_images, args.batch_size, args.measure_timeout)
+    report(results, labels)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Keras .h5 (default: first one app.model_loaders finds)")
+    parser.add_argument("--format", default="onnx,tflite", help="Comma-separated: onnx, tflite")
+    parser.add_argument("--int8", action="store_true", help="Quantize weights and activations to int8")
+    parser.add_argument("--calibration-dir", help="Sample images for int8 calibration")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--heldout-dir", help="Held-out images for the parity/latency/memory report")
+    parser.add_argument("--class-indices", default=CLASS_INDICES_PATH)
+    parser.add_argument("--max-images", type=int, default=500)
+    parser.add_argument("--latency-images", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--measure-timeout", type=float, default=600, help="Seconds to wait for each backend's report")
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+"""
+Export the Keras fertilizer MLP and its fitted preprocessor into a single .npz file
+served by app/fertilizer_engine.NumpyFertilizerModel (no TensorFlow at request time).
+
+Usage (from backend/):
+    python export_fertilizer_npz.py            # export + parity check
+    python export_fertilizer_npz.py --no-check # export only
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # backend/
+APP_DIR = os.path.join(BASE_DIR, "app")
+MODEL_PATH = os.path.join(APP_DIR, "final_model.keras")
+PREPROCESSOR_PATH = os.path.join(APP_DIR, "dl_preprocessor.joblib")
+NPZ_PATH = os.path.join(APP_DIR, "fertilizer_mlp.npz")
+
+SUPPORTED_ACTIVATIONS = {"linear", "relu", "sigmoid", "tanh"}
+
+
+def load_keras_model(path: str):
+    import tensorflow as tf
+    from tensorflow.keras.layers import InputLayer
+
+    # Same Keras version-mismatch fix as app.main (batch_shape vs batch_input_shape)
+    class PatchedInputLayer(InputLayer):
+        def __init__(self, *args, **kwargs):
+            if 'batch_shape' in kwargs:
+                kwargs['batch_input_shape'] = kwargs.pop('batch_shape')
+            super().__init__(*args, **kwargs)
+
+    return tf.keras.models.load_model(path, compile=False, custom_objects={'InputLayer': PatchedInputLayer})
+
+
+def export_fertilizer_model(model, preprocessor, out_path: str = NPZ_PATH) -> str:
+    # ColumnTransformer output order is the order of its fitted transformers: 'num' then 'cat'
+    fitted = [(name, transformer, columns) for name, transformer, columns in preprocessor.transformers_
+              if name != "remainder"]
+    names = [name for name, _, _ in fitted]
+    if names != ["num", "cat"]:
+        raise ValueError(f"Unexpected preprocessor layout {names}, expected ['num', 'cat']")
+    _, scaler, num_columns = fitted[0]
+    _, encoder, cat_columns = fitted[1]
+    if len(cat_columns) != 1:
+        raise ValueError(f"Expected a single categorical column, got {cat_columns}")
+
+    n_num = len(num_columns)
+    mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(n_num)
+    scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(n_num)
+
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue  # InputLayer / Dropout (no-op at inference)
+        activation = getattr(layer.activation, "__name__", str(layer.activation))
+        if activation not in SUPPORTED_ACTIVATIONS:
+            raise ValueError(f"Layer {layer.name} uses unsupported activation '{activation}'")
+        kernel, bias = weights
+        arrays[f"kernel_{len(activations)}"] = kernel.astype(np.float32)
+        arrays[f"bias_{len(activations)}"] = bias.astype(np.float32)
+        activations.append(activation)
+
+    np.savez_compressed(
+        out_path,
+        num_columns=np.array(num_columns),
+        cat_column=np.array(cat_columns[0]),
+        categories=np.array([str(c) for c in encoder.categories_[0]]),
+        scaler_mean=np.asarray(mean, dtype=np.float64),
+        scaler_scale=np.asarray(scale, dtype=np.float64),
+        activations=np.array(activations),
+        **arrays,
+    )
+    print(f"✅ Exported {len(activations)} dense layers to {out_path} ({os.path.getsize(out_path) / 1024:.1f} KiB)")
+    return out_path
+
+
+def check_parity(model, preprocessor, npz_path: str = NPZ_PATH, n_samples: int = 2000, atol: float = 1e-3) -> float:
+    """
+    Compare Keras + ColumnTransformer against the NumPy engine on random inputs drawn
+    around the fitted scaler statistics (plus an unknown crop). Returns the max abs diff.
+    """
+    sys.path.insert(0, BASE_DIR)
+    from app.fertilizer_engine import NumpyFertilizerModel
+
+    engine = NumpyFertilizerModel(npz_path)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        column: rng.normal(engine.mean[i], engine.scale[i], n_samples)
+        for i, column in enumerate(engine.num_columns)
+    })
+    df[engine.cat_column] = rng.choice(engine.categories + ["unknown_crop"], n_samples)
+
+    expected = model.predict(preprocessor.transform(df), batch_size=256, verbose=0)
+    actual = engine.predict(engine.transform(df))
+    max_diff = float(np.max(np.abs(expected - actual)))
+    print(f"Parity on {n_samples} rows: max |keras - numpy| = {max_diff:.2e} (atol {atol:g})")
+
+    one = df.iloc[:1]
+    for label, fn in [
+        ("keras", lambda: model.predict(preprocessor.transform(one), verbose=0)),
+        ("numpy", lambda: engine.predict(engine.transform(one))),
+    ]:
+        fn()
+        started = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"  {label:5s} single-row latency: {(time.perf_counter() - started) / 200 * 1e6:.1f} µs")
+
+    if max_diff > atol:
+        raise AssertionError(f"NumPy engine diverges from Keras model (max diff {max_diff:.2e} > {atol:g})")
+    return max_diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--preprocessor", default=PREPROCESSOR_PATH)
+    parser.add_argument("--out", default=NPZ_PATH)
+    parser.add_argument("--no-check", action="store_true", help="Skip the Keras parity check")
+    args = parser.parse_args()
+
+    keras_model = load_keras_model(args.model)
+    fitted_preprocessor = joblib.load(args.preprocessor)
+    export_fertilizer_model(keras_model, fitted_preprocessor, args.out)
+    if not args.no_check:
+        check_parity(keras_model, fitted_preprocessor, args.out)
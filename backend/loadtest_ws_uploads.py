@@ -0,0 +1,98 @@
+"""
+Load test: websocket heartbeat latency while disease images are being uploaded concurrently.
+
+A websocket client sends "ping" on /ws/alerts every --interval seconds and records the
+round trip to "pong", first with no load (baseline) and then while --concurrency clients
+keep posting --image to /disease/predict. If uploads block the event loop, the loaded
+heartbeat p99 jumps to the duration of a CNN/LLM call; otherwise it stays near baseline.
+
+Requires: pip install httpx websockets
+
+Usage (server running on :8000):
+    python loadtest_ws_uploads.py --image leaf.jpg --token <access_token> --concurrency 8 --duration 20
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+import websockets
+
+
+def summarize(label: str, samples: list):
+    if not samples:
+        print(f"{label}: no samples")
+        return
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(
+        f"{label}: n={len(samples)} p50={statistics.median(samples) * 1000:.1f}ms "
+        f"p99={p99 * 1000:.1f}ms max={ordered[-1] * 1000:.1f}ms"
+    )
+
+
+async def heartbeat(ws_url: str, interval: float, stop: asyncio.Event) -> list:
+    rtts = []
+    async with websockets.connect(ws_url) as ws:
+        while not stop.is_set():
+            started = time.perf_counter()
+            await ws.send("ping")
+            while await ws.recv() != "pong":
+                pass  # skip alerts pushed in between
+            rtts.append(time.perf_counter() - started)
+            await asyncio.sleep(interval)
+    return rtts
+
+
+async def uploader(client: httpx.AsyncClient, url: str, image: bytes, stop: asyncio.Event, results: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, files={"file": ("leaf.jpg", image, "image/jpeg")}, data={"language": "en"})
+            results.append((response.status_code, time.perf_counter() - started))
+        except httpx.HTTPError as e:
+            results.append((type(e).__name__, time.perf_counter() - started))
+
+
+async def run(args):
+    with open(args.image, "rb") as f:
+        image = f.read()
+    ws_url = args.base_url.replace("http", "ws", 1) + f"/ws/alerts?token={args.token}"
+
+    stop = asyncio.Event()
+    baseline = asyncio.create_task(heartbeat(ws_url, args.interval, stop))
+    await asyncio.sleep(min(5.0, args.duration))
+    stop.set()
+    summarize("heartbeat (idle)", await baseline)
+
+    stop = asyncio.Event()
+    uploads = []
+    async with httpx.AsyncClient(timeout=None) as client:
+        tasks = [
+            asyncio.create_task(uploader(client, args.base_url + "/disease/predict", image, stop, uploads))
+            for _ in range(args.concurrency)
+        ]
+        loaded = asyncio.create_task(heartbeat(ws_url, args.interval, stop))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        rtts = await loaded
+        await asyncio.gather(*tasks)
+
+    summarize(f"heartbeat ({args.concurrency} concurrent uploads)", rtts)
+    summarize("upload latency", [elapsed for _, elapsed in uploads])
+    statuses = {}
+    for status, _ in uploads:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"upload statuses: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--image", required=True, help="Leaf image to upload")
+    parser.add_argument("--token", required=True, help="Access token from /auth/login (the websocket is authenticated)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between heartbeats")
+    asyncio.run(run(parser.parse_args()))
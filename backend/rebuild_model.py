@@ -75,3 +75,8 @@ model.fit(X_train, y_train, epochs=50, batch_size=32, verbose=0)
 # Save Model
 model.save(MODEL_PATH)
 print(f"✅ Model saved to {MODEL_PATH}")
+
+# Export weights + preprocessor for the TensorFlow-free serving path
+from export_fertilizer_npz import export_fertilizer_model, check_parity
+export_fertilizer_model(model, preprocessor)
+check_parity(model, preprocessor)
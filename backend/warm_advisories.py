@@ -0,0 +1,50 @@
+"""
+Pre-generate disease advisories for every CNN class so /disease/predict never waits on the LLM
+for a known disease. Safe to re-run: stored advisories for the current index version are skipped
+unless --force is given.
+
+Usage (from backend/):
+    python warm_advisories.py --languages en,hi,or
+"""
+import asyncio
+import argparse
+
+from app.ml import ml_models
+from app.model_loaders import load_class_indices, load_disease_vectorstore
+from app.vectorstores import get_index_version, DISEASE_INDEX_DIR
+from app.advisory_store import get_advisory, save_advisory
+from app.routers.disease import get_rag_advice_async
+
+
+async def warm(languages, force=False):
+    # One event loop for the whole run: the cached RAG chains keep their async LLM client,
+    # whose connections belong to the loop they were first used on.
+    if not load_class_indices() or not load_disease_vectorstore():
+        print("❌ Class indices and the disease FAISS index are required to warm advisories.")
+        return
+
+    version = get_index_version(DISEASE_INDEX_DIR)
+    classes = sorted(set(ml_models["class_indices"].values()))
+    generated = skipped = failed = 0
+    for disease_class in classes:
+        for language in languages:
+            if not force and get_advisory(disease_class, language, version):
+                skipped += 1
+                continue
+            advice = await get_rag_advice_async(disease_class, language, refresh=force)
+            if advice and get_advisory(disease_class, language, version):
+                generated += 1
+                print(f"✅ {disease_class} ({language})")
+            else:
+                failed += 1
+                print(f"❌ {disease_class} ({language}): {advice}")
+
+    print(f"Done: {generated} generated, {skipped} already stored, {failed} failed (index version {version})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--languages", default="en", help="Comma-separated languages, e.g. en,hi,or")
+    parser.add_argument("--force", action="store_true", help="Regenerate advisories that are already stored")
+    args = parser.parse_args()
+    asyncio.run(warm([lang.strip() for lang in args.languages.split(",") if lang.strip()], force=args.force))
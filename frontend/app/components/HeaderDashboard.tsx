@@ -25,7 +25,10 @@ export default function Header({
     if (typeof window !== "undefined") {
       const protocol = window.location.protocol === "https:" ? "wss" : "ws";
       const host = window.location.hostname;
-      return `${protocol}://${host}:8000/ws/alerts`;
+      // The server only delivers alerts to authenticated sockets
+      const token = localStorage.getItem("token");
+      if (!token) return "";
+      return `${protocol}://${host}:8000/ws/alerts?token=${encodeURIComponent(token)}`;
     }
     return "";
   });
@@ -21,7 +21,13 @@ export const useWebSocket = (url: string, userId?: number) => {
           try {
             const data = JSON.parse(event.data);
 
-            // Check if the alert is for THIS user
+            // Server heartbeat
+            if (data.type === "ping") {
+              socket.send("pong");
+              return;
+            }
+
+            // The server only sends this user's alerts; the check guards against a stale socket
             if (userId && data.user_id === userId) {
               const alerts = data.messages;
               if (Array.isArray(alerts)) {
@@ -43,9 +49,11 @@ export const useWebSocket = (url: string, userId?: number) => {
           }
         };
 
-        socket.onclose = () => {
+        socket.onclose = (event) => {
           console.log("WebSocket Disconnected");
           setIsConnected(false);
+          // 1008: token rejected, retrying won't help until the user logs in again
+          if (event.code === 1008) return;
           // Reconnect after a delay
           setTimeout(connect, 3000);
         };
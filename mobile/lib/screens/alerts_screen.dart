@@ -1,8 +1,4 @@
-<<<<<<< HEAD
-// import 'dart:ui';
-=======
 import 'dart:async';
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
 import 'dart:convert';
 import 'package:flutter/material.dart';
 import 'package:hive_flutter/hive_flutter.dart';
@@ -19,15 +15,12 @@ class _AlertsScreenState extends State<AlertsScreen> {
   final _socketService = SocketService();
   List<Map<String, dynamic>> _alerts = [];
   Box? _alertsBox;
-<<<<<<< HEAD
-=======
   StreamSubscription? _subscription;
 
   // Throttling variables
   final List<Map<String, dynamic>> _bufferedAlerts = [];
   Timer? _throttleTimer;
   DateTime _lastSnackBarTime = DateTime.fromMillisecondsSinceEpoch(0);
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
 
   @override
   void initState() {
@@ -36,33 +29,6 @@ class _AlertsScreenState extends State<AlertsScreen> {
   }
 
   Future<void> _initializeAlerts() async {
-<<<<<<< HEAD
-    // Open Hive box for alerts
-    _alertsBox = await Hive.openBox('alerts');
-
-    // Load existing alerts
-    if (_alertsBox != null) {
-      final storedAlerts = _alertsBox!.values.toList();
-      setState(() {
-        _alerts = storedAlerts
-            .map((e) => Map<String, dynamic>.from(e))
-            .toList();
-        // Sort by timestamp descending if needed, but we insert at 0 so list is already reversed order of insertion
-        // If we want strict time sorting:
-        _alerts.sort((a, b) {
-          DateTime timeA =
-              DateTime.tryParse(a['timestamp'] ?? '') ?? DateTime.now();
-          DateTime timeB =
-              DateTime.tryParse(b['timestamp'] ?? '') ?? DateTime.now();
-          return timeB.compareTo(timeA);
-        });
-
-        // Keep only the last 50 alerts to prevent clutter
-        if (_alerts.length > 50) {
-          _alerts = _alerts.sublist(0, 50);
-        }
-      });
-=======
     _alertsBox = await Hive.openBox('alerts');
 
     if (_alertsBox != null) {
@@ -86,7 +52,6 @@ class _AlertsScreenState extends State<AlertsScreen> {
           }
         });
       }
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
     }
 
     _connectSocket();
@@ -94,89 +59,18 @@ class _AlertsScreenState extends State<AlertsScreen> {
 
   Future<void> _clearAlerts() async {
     await _alertsBox?.clear();
-<<<<<<< HEAD
-    setState(() {
-      _alerts.clear();
-    });
-=======
     if (mounted) {
       setState(() {
         _alerts.clear();
       });
     }
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
   }
 
   void _connectSocket() {
     _socketService.connect();
-<<<<<<< HEAD
-    _socketService.stream.listen(
-      (data) {
-        try {
-          // Parse the incoming JSON data
-          final parsedData = jsonDecode(data.toString());
-
-          // Extract messages and timestamp
-          final List<dynamic> messages = parsedData['messages'] ?? [];
-          final String timestamp =
-              parsedData['timestamp'] ?? DateTime.now().toString();
-
-          // Create a clean message string
-          final String cleanMessage = messages.isNotEmpty
-              ? messages.join('\n')
-              : 'Unknown Alert';
-
-          final newAlert = {
-            'message': cleanMessage,
-            'timestamp': timestamp,
-            'raw': data.toString(),
-          };
-
-          final bool isSoilMoisture = cleanMessage.toLowerCase().contains(
-            'low soil moisture',
-          );
-
-          setState(() {
-            if (isSoilMoisture) {
-              _alerts.removeWhere(
-                (a) => (a['message'] ?? '').toString().toLowerCase().contains(
-                  'low soil moisture',
-                ),
-              );
-            }
-            _alerts.insert(0, newAlert);
-          });
-
-          // Store in Hive
-          if (isSoilMoisture) {
-            _alertsBox?.put('latest_soil_moisture', newAlert);
-          } else {
-            _alertsBox?.add(newAlert);
-          }
-          if (mounted) {
-            ScaffoldMessenger.of(context).showSnackBar(
-              SnackBar(
-                content: Text(
-                  cleanMessage,
-                  style: const TextStyle(color: Colors.white),
-                ),
-                backgroundColor: Colors.red.shade800,
-                behavior: SnackBarBehavior.floating,
-                shape: RoundedRectangleBorder(
-                  borderRadius: BorderRadius.circular(10),
-                ),
-                duration: const Duration(seconds: 5),
-              ),
-            );
-          }
-        } catch (e) {
-          print('Error parsing alert data: $e');
-        }
-=======
     _subscription = _socketService.stream.listen(
       (data) {
         _handleIncomingData(data);
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
       },
       onError: (error) {
         print('Socket error: $error');
@@ -184,11 +78,6 @@ class _AlertsScreenState extends State<AlertsScreen> {
     );
   }
 
-<<<<<<< HEAD
-  @override
-  void dispose() {
-    _socketService.disconnect();
-=======
   void _handleIncomingData(dynamic data) {
     try {
       final parsedData = jsonDecode(data.toString());
@@ -278,7 +167,6 @@ class _AlertsScreenState extends State<AlertsScreen> {
     _throttleTimer?.cancel();
     _subscription?.cancel();
     _socketService.dispose();
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
     super.dispose();
   }
 
@@ -1,89 +1,81 @@
-<<<<<<< HEAD
-=======
 import 'dart:async';
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
+import 'dart:convert';
+import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:web_socket_channel/web_socket_channel.dart';
 import '../constants.dart';
 
 class SocketService {
   WebSocketChannel? _channel;
-<<<<<<< HEAD
-
-  Stream get stream {
-    if (_channel == null) {
-      connect();
-    }
-    return _channel!.stream;
-  }
-
-  void connect() {
-=======
   final StreamController _controller = StreamController.broadcast();
+  final FlutterSecureStorage _storage = const FlutterSecureStorage();
   bool _isConnected = false;
 
   Stream get stream => _controller.stream;
 
-  void connect() {
+  Future<void> connect() async {
     if (_isConnected) return;
+    _isConnected = true;
 
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
     try {
+      // Alerts are delivered per user: the socket authenticates with the REST access token
+      final token = await _storage.read(key: 'access_token');
+      if (token == null) {
+        print('Not logged in; alerts socket not opened');
+        _isConnected = false;
+        return;
+      }
+
       final uri = Uri.parse(AppConstants.baseUrl);
       final scheme = uri.scheme == 'https' ? 'wss' : 'ws';
 
-<<<<<<< HEAD
-      // Explicitly construct the WebSocket URI
-=======
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
       final wsUri = Uri(
         scheme: scheme,
         host: uri.host,
         port: uri.port,
         path: '/ws/alerts',
+        queryParameters: {'token': token},
       );
 
-<<<<<<< HEAD
-      print('Attempting to connect to WebSocket: $wsUri');
-      _channel = WebSocketChannel.connect(wsUri);
-    } catch (e) {
-      print('Error connecting to WebSocket: $e');
-=======
-      print('Connecting to WebSocket: $wsUri');
+      print('Connecting to WebSocket: ${wsUri.replace(queryParameters: {})}');
       _channel = WebSocketChannel.connect(wsUri);
-      _isConnected = true;
 
       _channel!.stream.listen(
         (data) {
+          // Server heartbeat: answer and don't surface it as an alert
+          if (data is String && data.contains('"ping"')) {
+            try {
+              if (jsonDecode(data)['type'] == 'ping') {
+                _channel?.sink.add('pong');
+                return;
+              }
+            } catch (_) {}
+          }
           _controller.add(data);
         },
         onError: (error) {
           print('WebSocket Error: $error');
           _isConnected = false;
-          // _controller.addError(error); // Optional: propagate error
         },
         onDone: () {
-          print('WebSocket Closed');
+          // 1008: token invalid or expired; reconnecting won't help until the user logs in again
+          print('WebSocket Closed (code ${_channel?.closeCode})');
           _isConnected = false;
         },
       );
     } catch (e) {
       print('Connection failed: $e');
       _isConnected = false;
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
     }
   }
 
   void disconnect() {
     _channel?.sink.close();
     _channel = null;
-<<<<<<< HEAD
-=======
     _isConnected = false;
   }
 
   void dispose() {
     disconnect();
     _controller.close();
->>>>>>> eb9d84b43aa988147346dc664959429ed6a207b3
   }
 }